@@ -2,123 +2,490 @@
 Release Note Agent — CLI entry point.
 
 Usage:
-    python agent.py [--poll N]
-
-The main thread runs an async Claude SDK conversational loop.
-A background daemon thread polls SQLite every N seconds, detects
-RESOLVED→OPEN transitions, and removes those rows from the live .docx.
+    python agent.py [--poll N] [--debounce MS] [--history-tokens N]
+                    [--metrics-interval S] [--template DOCX]
+    python agent.py --generate LABEL [--backend fast] [--force]
+    python agent.py --generate-all [--workers N] [--backend fast] [--force]
+
+    Either form takes --profile [--profile-dir DIR] [--profile-threshold MS]
+    [--slow-query MS] to dump cProfile output for slow operations.
+
+The main thread runs an async Claude SDK conversational loop; history.py keeps
+the conversation under a token budget and marks its prefix for prompt caching.
+Obvious commands (generate <label>, list labels, status of defect N, exit) are
+recognised locally by route_intent and never reach the model. Everything else
+goes to Claude, which acts through TOOLS; each tool runs as soon as its block
+finishes streaming, and doc generation runs on a worker thread.
+A background daemon thread is woken whenever the database changes (falling
+back to a data_version check at most every N seconds), reads the change feed,
+detects RESOLVED→OPEN transitions, and removes those rows from the live .docx.
 """
-import asyncio
 import threading
 import argparse
 import sys
 import re
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
-from dotenv import load_dotenv
-load_dotenv()
-
-import anthropic
+# asyncio, anthropic and dotenv are imported where the conversation needs
+# them: --generate / --generate-all never talk to the model and start without.
 import db
+import db_pool
 import doc_generator
+import history
+import metrics
+import profiling
 
 # ---------------------------------------------------------------------------
-# Shared state (thread-safe via lock / Event)
+# Shared state (thread-safe via per-label locks / Event)
 # ---------------------------------------------------------------------------
+class ResolvedIds:
+    """Set of RESOLVED defect ids stored as a bitset, one bit per id.
+
+    Ids are dense AUTOINCREMENT keys, so a million defects take about 128 KB
+    here instead of the ~70 MB of a dict mapping id -> status.
+    """
+    __slots__ = ('_bits',)
+
+    def __init__(self, ids=()):
+        self._bits = bytearray()
+        for defect_id in ids:
+            self.add(defect_id)
+
+    def __contains__(self, defect_id: int) -> bool:
+        byte = defect_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (defect_id & 7)))
+
+    def __len__(self) -> int:
+        return int.from_bytes(self._bits, 'little').bit_count()
+
+    def add(self, defect_id: int) -> None:
+        byte = defect_id >> 3
+        if byte >= len(self._bits):
+            # Grow geometrically so seeding in id order stays linear
+            self._bits.extend(bytes(max(byte + 1, 2 * len(self._bits)) - len(self._bits)))
+        self._bits[byte] |= 1 << (defect_id & 7)
+
+    def discard(self, defect_id: int) -> None:
+        byte = defect_id >> 3
+        if byte < len(self._bits):
+            self._bits[byte] &= ~(1 << (defect_id & 7)) & 0xFF
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
 shutdown_event = threading.Event()
-doc_lock = threading.Lock()
 active_label: str | None = None
-status_cache: dict[int, str] = {}
+resolved_ids = ResolvedIds()  # poller's view of which defects are RESOLVED
+change_cursor: int = 0
+doc_scheduler: doc_generator.WriteScheduler | None = None
+_generation_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="generate")
+_generations: set[Future] = set()
+_generations_lock = threading.Lock()
 
 # ---------------------------------------------------------------------------
 # System prompt
 # ---------------------------------------------------------------------------
+MODEL = "claude-opus-4-6"
+HISTORY_TOKENS = 8000  # older turns are summarized once history exceeds this
+
 SYSTEM_PROMPT = """\
 You are a Release Note Assistant. You help users generate and manage release notes.
 
-When the user asks you to generate release notes for a specific label or version
-(e.g. "generate release notes for v1.0"), include the token ACTION:GENERATE:<label>
-on its own line somewhere in your response (replace <label> with the actual value,
-e.g. ACTION:GENERATE:v1.0).
-
-When the user asks to exit, quit, or shut down, include the token ACTION:SHUTDOWN
-on its own line in your response.
+Use the tools to act: generate_release_notes when the user asks for release notes
+for a label or version (e.g. "generate release notes for v1.0" → label "v1.0"),
+shutdown when they ask to exit, quit, or shut down, and list_labels /
+get_defect_status to answer questions about the data.
 
-Always give a brief, helpful conversational reply in addition to any action token.
+Always give a brief, helpful conversational reply alongside any tool call.
 """
 
+TOOLS = [
+    {
+        "name": "generate_release_notes",
+        "description": "Build the release notes .docx for a label from its RESOLVED "
+                       "defects. Runs in the background; the document keeps tracking "
+                       "later status changes.",
+        "input_schema": {
+            "type": "object",
+            "properties": {"label": {"type": "string", "description": "e.g. v1.0"}},
+            "required": ["label"],
+        },
+    },
+    {
+        "name": "shutdown",
+        "description": "Stop the agent.",
+        "input_schema": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "list_labels",
+        "description": "List every release label that has defects.",
+        "input_schema": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "get_defect_status",
+        "description": "Look up one defect's label, status and title.",
+        "input_schema": {
+            "type": "object",
+            "properties": {"defect_id": {"type": "integer"}},
+            "required": ["defect_id"],
+        },
+    },
+]
+# tool name -> (run_intent intent, input field carrying its argument)
+TOOL_INTENTS = {
+    "generate_release_notes": ("generate", "label"),
+    "shutdown": ("shutdown", None),
+    "list_labels": ("list_labels", None),
+    "get_defect_status": ("status", "defect_id"),
+}
+
 # ---------------------------------------------------------------------------
 # Background polling thread
 # ---------------------------------------------------------------------------
+@profiling.profiled('poll')
+@metrics.timed('poll_tick_seconds')
+def poll_once() -> int:
+    """Apply changes recorded since the last tick; return how many were seen.
+
+    Work is proportional to the number of new rows in the change feed, so an
+    idle tick costs a single indexed lookup regardless of table size.
+    """
+    global change_cursor
+
+    try:
+        changes = db.get_changes_since(change_cursor)
+    except db.CursorExpired as exc:
+        return _resync(exc)
+    if not changes:
+        return 0
+
+    metrics.inc('poll_changes_total', len(changes))
+    label = active_label
+    reverted = []
+    resolved = 0
+    before = {}  # defect_id -> was RESOLVED before this batch, for the active label
+    latest = {}  # defect_id -> last status seen in this batch
+    for change in changes:
+        defect_id = change['defect_id']
+        was_resolved = defect_id in resolved_ids
+        now_resolved = change['status'] == 'RESOLVED'
+        if change['label'] == label:
+            if was_resolved and not now_resolved:
+                reverted.append(defect_id)
+            elif now_resolved and not was_resolved:
+                resolved += 1
+            before.setdefault(defect_id, was_resolved)
+            latest[defect_id] = change['status']
+        if now_resolved:
+            resolved_ids.add(defect_id)
+        else:
+            resolved_ids.discard(defect_id)
+    change_cursor = changes[-1]['seq']
+
+    if not latest:
+        return len(changes)
+    metrics.inc('poll_transitions_total', len(reverted), kind='reverted')
+    metrics.inc('poll_transitions_total', resolved, kind='resolved')
+
+    for defect_id in reverted:
+        print(
+            f"\n[POLL] Defect {defect_id} reverted to OPEN — "
+            f"removing from '{label}' release notes...",
+            flush=True,
+        )
+    removed = [i for i, status in latest.items() if status == 'OPEN' and before[i]]
+    added = [
+        d for d in db.get_defects_by_ids(i for i, status in latest.items() if status == 'RESOLVED')
+        if d['status'] == 'RESOLVED' and d['label'] == label
+    ]
+    if doc_scheduler is not None:
+        # Coalesced with anything else arriving inside the debounce window
+        doc_scheduler.submit(label, removed=removed, added=added)
+    else:
+        with doc_generator.label_lock(label):
+            path = doc_generator.apply_changes(label, removed=removed, added=added)
+        _report_write(label, path, removed, added)
+
+    return len(changes)
+
+
+def _resync(expired: db.CursorExpired) -> int:
+    """Rebuild the poller's state after falling behind the retained change feed."""
+    global change_cursor, resolved_ids
+    print(f"\n[POLL] {expired} — reloading resolved defects...", flush=True)
+    change_cursor = db.get_change_cursor()  # later changes are replayed next tick
+    resolved_ids = ResolvedIds(db.iter_resolved_ids())
+    label = active_label
+    if label is not None:
+        if doc_scheduler is not None:
+            doc_scheduler.flush(label)  # don't let queued patches land on the rebuild
+        with doc_generator.label_lock(label):
+            path = doc_generator.create_doc(label)
+        print(f"[POLL] '{label}' rebuilt → {path}", flush=True)
+    return 0
+
+
+def _report_write(label, path, removed, added, time_to_doc_ms=None) -> None:
+    if not path or not (removed or added):
+        return
+    timing = f" in {time_to_doc_ms:.0f} ms" if time_to_doc_ms is not None else ""
+    print(
+        f"[POLL] '{label}' patched{timing}: {len(removed)} removed, "
+        f"{len(added)} added → {path}",
+        flush=True,
+    )
+
+
 def poll_loop(interval: int) -> None:
-    global status_cache, active_label
+    # Woken by db writes as they commit; `interval` only caps the fallback
+    # data_version backoff, so an idle agent does almost no work.
+    watcher = db.ChangeWatcher(max_wait=interval)
+    changed = True  # catch up on anything committed before the watcher existed
+    try:
+        while not shutdown_event.is_set():
+            if not changed:
+                changed = watcher.wait(interval)
+                continue
+            changed = False
+            try:
+                poll_once()
+            except Exception as exc:
+                print(f"\n[POLL ERROR] {exc}", file=sys.stderr, flush=True)
+    finally:
+        watcher.close()
+
 
+def metrics_loop(interval: float) -> None:
+    """Print what moved in the metrics registry every ``interval`` seconds."""
+    previous = None
     while not shutdown_event.wait(interval):
-        try:
-            current = {d['id']: d['status'] for d in db.get_all_defects()}
-
-            for defect_id, old_status in list(status_cache.items()):
-                new_status = current.get(defect_id)
-                if old_status == 'RESOLVED' and new_status == 'OPEN':
-                    label = active_label
-                    if label:
-                        print(
-                            f"\n[POLL] Defect {defect_id} reverted to OPEN — "
-                            f"removing from '{label}' release notes...",
-                            flush=True,
-                        )
-                        with doc_lock:
-                            doc_generator.remove_row(label, defect_id)
-                        print(
-                            f"[POLL] Defect {defect_id} removed. "
-                            f"Regenerating release notes for '{label}'...",
-                            flush=True,
-                        )
-                        with doc_lock:
-                            path = doc_generator.create_doc(label)
-                        print(f"[POLL] Regenerated → {path}", flush=True)
-
-            status_cache.update(current)
-        except Exception as exc:
-            print(f"\n[POLL ERROR] {exc}", file=sys.stderr, flush=True)
+        lines, previous = metrics.summary(previous)
+        for line in lines:
+            print(f"[METRICS] {line}", flush=True)
 
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 async def _read_line(prompt: str = "> ") -> str:
+    import asyncio
     loop = asyncio.get_event_loop()
     return await loop.run_in_executor(None, lambda: input(prompt))
 
 
-def _handle_actions(assistant_text: str) -> None:
+def _input_tokens(usage) -> tuple[int, int]:
+    """(total input tokens, tokens read from the prompt cache) for one response."""
+    cached = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    created = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    return usage.input_tokens + cached + created, cached
+
+
+def _generate(label: str) -> None:
+    print(f"\n[ACTION] Generating release notes for '{label}'...", flush=True)
+    with doc_generator.label_lock(label):
+        try:
+            path = doc_generator.create_doc(label)
+            print(f"[ACTION] Saved → {path}", flush=True)
+        except Exception as exc:
+            print(f"[ACTION ERROR] {exc}", file=sys.stderr, flush=True)
+
+
+def start_generation(label: str) -> Future:
+    """Build ``label``'s doc on a worker thread so the conversation carries on."""
     global active_label
+    active_label = label
+    future = _generation_pool.submit(_generate, label)
+    with _generations_lock:
+        _generations.add(future)
+    future.add_done_callback(_generation_done)
+    return future
 
-    # ACTION:GENERATE:<label>
-    match = re.search(r'ACTION:GENERATE:(\S+)', assistant_text)
-    if match:
-        label = match.group(1)
-        active_label = label
-        print(f"\n[ACTION] Generating release notes for '{label}'...", flush=True)
-        with doc_lock:
-            try:
-                path = doc_generator.create_doc(label)
-                print(f"[ACTION] Saved → {path}", flush=True)
-            except Exception as exc:
-                print(f"[ACTION ERROR] {exc}", file=sys.stderr, flush=True)
 
-    # ACTION:SHUTDOWN
-    if 'ACTION:SHUTDOWN' in assistant_text:
+def _generation_done(future: Future) -> None:
+    with _generations_lock:
+        _generations.discard(future)
+
+
+def wait_for_generations(timeout: float | None = None) -> None:
+    with _generations_lock:
+        pending = list(_generations)
+    wait(pending, timeout=timeout)
+
+
+# ---------------------------------------------------------------------------
+# Local intent router — obvious commands never reach the model
+# ---------------------------------------------------------------------------
+_INTENT_PATTERNS = (
+    ('shutdown', re.compile(r'(?:exit|quit|bye|shutdown|shut\s+down)')),
+    ('list_labels', re.compile(
+        r'(?:list|show)\s+(?:all\s+|the\s+)?labels|(?:what|which)\s+labels(?:\s+are\s+there)?'
+    )),
+    ('status', re.compile(
+        r"(?:what(?:'s|\s+is)\s+the\s+)?status\s+(?:of\s+)?(?:defect\s+)?#?(\d+)"
+        r"|(?:defect\s+)?#?(\d+)\s+status"
+    )),
+    ('generate', re.compile(
+        r'(?:please\s+)?(?:generate|create|build)\s+(?:the\s+)?'
+        r'(?:release\s+notes?\s+(?:for\s+)?)?(?:label\s+)?([\w.\-]+)'
+    )),
+)
+
+
+def route_intent(text: str) -> tuple[str, str | None] | None:
+    """Match ``text`` against the local commands; None means ask the model.
+
+    Only whole-input matches count, and ``generate`` only for a label that
+    exists, so anything ambiguous still gets a conversational answer.
+    """
+    text = text.strip().rstrip('.!?').strip().lower()
+    for intent, pattern in _INTENT_PATTERNS:
+        match = pattern.fullmatch(text)
+        if not match:
+            continue
+        arg = next((group for group in match.groups() if group), None)
+        if intent == 'generate':
+            labels = {label.lower(): label for label in db.get_labels()}
+            if arg not in labels:
+                return None
+            arg = labels[arg]
+        return intent, arg
+    return None
+
+
+def run_intent(intent: str, arg: str | None) -> str:
+    """Carry out a routed command; return the reply shown to the user."""
+    if intent == 'shutdown':
         shutdown_event.set()
+        return "Shutting down."
+    if intent == 'list_labels':
+        labels = db.get_labels()
+        return f"Labels: {', '.join(labels)}" if labels else "No labels yet."
+    if intent == 'status':
+        defect = db.get_defect(int(arg))
+        if defect is None:
+            return f"Defect {arg} not found."
+        return f"Defect {defect['id']} ({defect['label']}) is {defect['status']}: {defect['title']}"
+    if intent == 'generate':
+        start_generation(arg)
+        return f"Generating release notes for '{arg}'."
+    raise ValueError(f"unknown intent {intent!r}")
+
+
+# ---------------------------------------------------------------------------
+# Tool use
+# ---------------------------------------------------------------------------
+def run_tool(block) -> dict:
+    """Execute a completed tool_use block; return its tool_result block."""
+    try:
+        intent, field = TOOL_INTENTS[block.name]
+        arg = str(block.input[field]) if field else None
+        content, is_error = run_intent(intent, arg), False
+    except Exception as exc:
+        content, is_error = f"{type(exc).__name__}: {exc}", True
+    result = {"type": "tool_result", "tool_use_id": block.id, "content": content}
+    if is_error:
+        result["is_error"] = True
+    return result
+
+
+def _block_dict(block) -> dict:
+    if block.type == "tool_use":
+        return {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+    return {"type": "text", "text": block.text}
+
+
+async def respond(client, conversation: history.ConversationHistory) -> list:
+    """Stream the model's reply to the latest turn; return each request's usage.
+
+    Tools run the moment their block is complete, while the rest of the reply
+    is still streaming. If the model stopped to wait for tool results, they
+    are sent back and the reply continues — unless a tool shut the agent down.
+    """
+    usages = []
+    while True:
+        results = []
+        async with client.messages.stream(
+            model=MODEL,
+            max_tokens=1024,
+            system=conversation.system_blocks(),
+            messages=conversation.request_messages(),
+            tools=TOOLS,
+        ) as stream:
+            print("\nAssistant: ", end="", flush=True)
+            async for event in stream:
+                if event.type == "text":
+                    print(event.text, end="", flush=True)
+                elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                    results.append(run_tool(event.content_block))
+            print("\n", flush=True)
+            final = await stream.get_final_message()
+
+        usages.append(final.usage)
+        conversation.add_assistant([_block_dict(block) for block in final.content])
+        if not results:
+            return usages
+        conversation.add_user(results)
+        if final.stop_reason != "tool_use" or shutdown_event.is_set():
+            return usages
+
+
+# ---------------------------------------------------------------------------
+# Batch generation (no conversation)
+# ---------------------------------------------------------------------------
+def generate_label(label: str, backend: str | None, force: bool) -> int:
+    db.init_db()
+    try:
+        if label not in db.get_labels():
+            print(f"[BATCH ERROR] Unknown label '{label}'", file=sys.stderr, flush=True)
+            return 1
+        path = doc_generator.create_doc(label, backend=backend, force=force)
+        print(f"[BATCH] {label} → {path}", flush=True)
+        return 0
+    except Exception as exc:
+        print(f"[BATCH ERROR] {label}: {exc}", file=sys.stderr, flush=True)
+        return 1
+    finally:
+        db.close_write_queue()
+        db_pool.close_all()
+
+
+def generate_all(workers: int | None, backend: str | None, force: bool) -> int:
+    db.init_db()
+    labels = db.get_labels()
+    print(f"[BATCH] Generating release notes for {len(labels)} label(s)...", flush=True)
+    failed = 0
+    for label, result in sorted(doc_generator.create_docs(
+        labels, workers=workers, backend=backend, force=force,
+    ).items()):
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"[BATCH ERROR] {label}: {result}", file=sys.stderr, flush=True)
+        else:
+            print(f"[BATCH] {label} → {result}", flush=True)
+    db.close_write_queue()
+    db_pool.close_all()
+    return 1 if failed else 0
 
 
 # ---------------------------------------------------------------------------
 # Main async loop
 # ---------------------------------------------------------------------------
-async def main(poll_interval: int) -> None:
-    # Initialise DB and seed status cache (no transitions on startup)
+async def main(poll_interval: int, debounce_ms: int = 250,
+               history_tokens: int = HISTORY_TOKENS, metrics_interval: float = 60) -> None:
+    import anthropic
+    from dotenv import load_dotenv
+    load_dotenv()  # ANTHROPIC_API_KEY
+
+    # Initialise DB and seed the RESOLVED set (no transitions on startup)
     db.init_db()
-    global status_cache
-    status_cache = {d['id']: d['status'] for d in db.get_all_defects()}
+    global resolved_ids, change_cursor, doc_scheduler
+    doc_scheduler = doc_generator.WriteScheduler(
+        window=debounce_ms / 1000, on_write=_report_write,
+    )
+    change_cursor = db.get_change_cursor()
+    resolved_ids = ResolvedIds(db.iter_resolved_ids())
 
     # Start background polling thread
     threading.Thread(
@@ -127,9 +494,21 @@ async def main(poll_interval: int) -> None:
         daemon=True,
         name="poll-thread",
     ).start()
+    if metrics_interval > 0 and metrics.enabled():
+        threading.Thread(
+            target=metrics_loop,
+            args=(metrics_interval,),
+            daemon=True,
+            name="metrics-thread",
+        ).start()
 
     client = anthropic.AsyncAnthropic()
-    messages: list[dict] = []
+    conversation = history.ConversationHistory(
+        SYSTEM_PROMPT,
+        budget=history_tokens,
+        summarize=history.client_summarizer(client, MODEL),
+    )
+    turn_tokens: list[tuple[int, int]] = []  # (input tokens, of which cached)
 
     print("Release Note Agent ready. Type a message to get started.")
     print("Example: 'Generate release notes for v1.0'")
@@ -148,34 +527,54 @@ async def main(poll_interval: int) -> None:
         if not user_input:
             continue
 
-        messages.append({"role": "user", "content": user_input})
+        routed = route_intent(user_input)
+        if routed is not None:
+            reply = run_intent(*routed)
+            print(f"\n[LOCAL] {reply}\n", flush=True)
+            # Keep the model aware of what happened for follow-up questions
+            conversation.add_user(user_input)
+            conversation.add_assistant(reply)
+            continue
 
-        # Stream response from Claude
-        try:
-            async with client.messages.stream(
-                model="claude-opus-4-6",
-                max_tokens=1024,
-                system=SYSTEM_PROMPT,
-                messages=messages,
-            ) as stream:
-                print("\nAssistant: ", end="", flush=True)
-                async for chunk in stream.text_stream:
-                    print(chunk, end="", flush=True)
-                print("\n", flush=True)
-
-                final = await stream.get_final_message()
-                assistant_text = "".join(
-                    block.text for block in final.content if block.type == "text"
-                )
+        conversation.add_user(user_input)
 
+        # Stream response from Claude, running tools as they arrive
+        try:
+            usages = await respond(client, conversation)
         except anthropic.APIError as exc:
             print(f"\n[API ERROR] {exc}", file=sys.stderr, flush=True)
-            messages.pop()  # remove failed user turn
+            conversation.discard_turn()  # remove failed user turn
             continue
 
-        messages.append({"role": "assistant", "content": assistant_text})
-        _handle_actions(assistant_text)
-
+        conversation.record_usage(usages[-1])
+        turn_tokens.extend(_input_tokens(usage) for usage in usages)
+        try:
+            await conversation.compact()
+        except anthropic.APIError as exc:
+            print(f"[HISTORY ERROR] summary failed, old turns dropped: {exc}",
+                  file=sys.stderr, flush=True)
+
+    wait_for_generations()  # let an in-flight doc build finish
+    doc_scheduler.close()
+    stats = doc_scheduler.metrics()
+    if stats['writes']:
+        print(
+            f"[DOC] {stats['writes']} write(s) for {stats['changes']} change(s); "
+            f"time-to-doc avg {stats['avg_ms']:.0f} ms, max {stats['max_ms']:.0f} ms",
+            flush=True,
+        )
+    if turn_tokens:
+        total = sum(tokens for tokens, _ in turn_tokens)
+        cached = sum(cached for _, cached in turn_tokens)
+        print(
+            f"[CHAT] {len(turn_tokens)} request(s); input tokens avg "
+            f"{total / len(turn_tokens):.0f}, max {max(t for t, _ in turn_tokens)}, "
+            f"{100 * cached / max(total, 1):.0f}% from cache; "
+            f"{conversation.compactions} compaction(s)",
+            flush=True,
+        )
+    db.close_write_queue()
+    db_pool.close_all()
     print("Agent shut down.")
 
 
@@ -189,7 +588,67 @@ if __name__ == "__main__":
         type=int,
         default=10,
         metavar="N",
-        help="Poll interval in seconds (default: 10)",
+        help="Max seconds between fallback change checks (default: 10)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=int,
+        default=250,
+        metavar="MS",
+        help="Coalesce doc writes per label within this window (default: 250)",
+    )
+    parser.add_argument(
+        "--history-tokens",
+        type=int,
+        default=HISTORY_TOKENS,
+        metavar="N",
+        help=f"Summarize older conversation turns beyond N tokens (default: {HISTORY_TOKENS})",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=60,
+        metavar="S",
+        help="Print a [METRICS] summary every S seconds; 0 disables (default: 60)",
+    )
+    parser.add_argument(
+        "--template",
+        metavar="DOCX",
+        help="Build release notes on top of this .docx (styles, page setup, letterhead)",
+    )
+    parser.add_argument(
+        "--generate",
+        metavar="LABEL",
+        help="Generate release notes for one label, then exit (no API key needed)",
+    )
+    parser.add_argument(
+        "--generate-all",
+        action="store_true",
+        help="Generate release notes for every label on a process pool, then exit",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="Worker processes for --generate-all (default: CPU count)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=doc_generator.BACKENDS,
+        help="Document backend for --generate / --generate-all (default: docx)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --generate / --generate-all, rewrite docs even if their inputs are unchanged",
     )
+    profiling.add_arguments(parser)
     args = parser.parse_args()
-    asyncio.run(main(args.poll))
+    profiling.enable_from_args(args)
+    doc_generator.TEMPLATE_PATH = args.template
+    if args.generate:
+        sys.exit(generate_label(args.generate, args.backend, args.force))
+    if args.generate_all:
+        sys.exit(generate_all(args.workers, args.backend, args.force))
+    import asyncio
+    asyncio.run(main(args.poll, args.debounce, args.history_tokens, args.metrics_interval))
@@ -0,0 +1,335 @@
+"""
+Benchmark suite — DB, doc generation, HTTP API and the change poller at scale.
+
+Seeds a database with synthetic defects spread over many labels, then times:
+    db.get_resolved_defects       one label's RESOLVED rows
+    doc.create_doc[docx|fast]     full regeneration of one label's doc
+    doc.remove_row                patching one row out of a live doc
+    api.defects_page              GET /api/defects?after_id=&limit=100
+    api.defects_label             GET /api/defects?label=&status=&limit=100
+    poll.idle_tick                agent.poll_once with nothing new
+    poll.tick_50_changes          agent.poll_once applying 50 status changes
+
+The API is measured against server.run in a separate process, from
+concurrent keep-alive clients. Results are written as JSON; with --check,
+any statistic above its limit in thresholds.json fails the run.
+
+Usage:
+    python benchmarks/bench.py [--sizes 1000,100000,1000000] [--output FILE]
+                               [--db-dir DIR] [--check] [--thresholds FILE]
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import db_pool
+import doc_generator
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+DEFAULT_SIZES = (1000, 100000)
+SEED_CHUNK = 10000
+RESOLVED_SHARE = 0.7
+API_CLIENTS = 8
+API_REQUESTS = 200  # per client
+POLL_CHANGES = 50
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+def label_count(size):
+    """Labels grow with the square root of the size: 3 at 1k, 100 at 1M."""
+    return max(3, round(size ** 0.5 / 10))
+
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+
+    def pct(p):
+        return samples[min(len(samples) - 1, round(p / 100 * (len(samples) - 1)))]
+
+    return {
+        'n': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(pct(50), 3),
+        'p95_ms': round(pct(95), 3),
+        'p99_ms': round(pct(99), 3),
+    }
+
+
+def timed(fn, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples)
+
+
+def seed(path, size, rng):
+    """Create ``path`` with ``size`` defects, or reuse it if already seeded."""
+    db.DB_PATH = path
+    db.init_db()
+    existing = db.get_conn().execute("SELECT COUNT(*) FROM defects").fetchone()[0]
+    if existing == size:
+        return 0.0
+    if existing:
+        raise SystemExit(f"{path} holds {existing} defects, expected {size}; remove it")
+
+    labels = [f'v{n // 10}.{n % 10}' for n in range(label_count(size))]
+    start = time.perf_counter()
+    for offset in range(0, size, SEED_CHUNK):
+        db.create_defects(
+            {
+                'title': f'Synthetic defect {i}',
+                'date': f'2024-{1 + i % 12:02d}-{1 + i % 28:02d}',
+                'developer_comment': 'Fixed in benchmark seed' if i % 3 else '',
+                'label': labels[i % len(labels)],
+                'status': 'RESOLVED' if rng.random() < RESOLVED_SHARE else 'OPEN',
+            }
+            for i in range(offset, min(offset + SEED_CHUNK, size))
+        )
+    return time.perf_counter() - start
+
+
+def _serve(db_path, port):
+    import server
+    db.DB_PATH = db_path
+    sys.stdout = open(os.devnull, 'w')  # stdout may be carrying the JSON report
+    server.run(port=port)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+def bench_db(label):
+    return {'db.get_resolved_defects': timed(lambda: db.get_resolved_defects(label), 50)}
+
+
+def bench_docs(label):
+    results = {}
+    for backend in doc_generator.BACKENDS:
+        results[f'doc.create_doc[{backend}]'] = timed(
+            lambda: doc_generator.create_doc(label, backend=backend, force=True), 3,
+        )
+    ids = iter(d['id'] for d in db.get_resolved_defects(label))
+    results['doc.remove_row'] = timed(lambda: doc_generator.remove_row(label, next(ids)), 10)
+    doc_generator.forget(label)
+    return results
+
+
+def bench_api(path, size, label):
+    port = _free_port()
+    proc = multiprocessing.get_context('spawn').Process(
+        target=_serve, args=(path, port), daemon=True,
+    )
+    proc.start()
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or not proc.is_alive():
+                raise SystemExit("benchmark server did not start")
+            time.sleep(0.05)
+
+    def run(make_path):
+        latencies = []
+        lock = threading.Lock()
+
+        def client(seed_value):
+            rng = random.Random(seed_value)
+            conn = http.client.HTTPConnection('localhost', port)
+            local = []
+            for _ in range(API_REQUESTS):
+                start = time.perf_counter()
+                conn.request('GET', make_path(rng))
+                resp = conn.getresponse()
+                resp.read()
+                local.append((time.perf_counter() - start) * 1000)
+                assert resp.status == 200, resp.status
+            conn.close()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(API_CLIENTS)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        stats = summarize(latencies)
+        stats['rps'] = round(len(latencies) / elapsed, 1)
+        return stats
+
+    try:
+        return {
+            'api.defects_page': run(
+                lambda rng: f'/api/defects?after_id={rng.randrange(size)}&limit=100'
+            ),
+            'api.defects_label': run(
+                lambda rng: f'/api/defects?label={label}&status=RESOLVED&limit=100'
+                            f'&after_id={rng.randrange(size)}'
+            ),
+        }
+    finally:
+        proc.terminate()  # SIGTERM → graceful shutdown
+        proc.join(10)
+
+
+def bench_poller(label):
+    import agent
+
+    agent.active_label = label
+    agent.doc_scheduler = None
+    agent.change_cursor = db.get_change_cursor()
+    agent.resolved_ids = agent.ResolvedIds(db.iter_resolved_ids())
+    doc_generator.create_doc(label, backend='fast', force=True)
+
+    quiet = contextlib.redirect_stdout(io.StringIO())  # [POLL] lines
+    with quiet:
+        results = {'poll.idle_tick': timed(agent.poll_once, 200)}
+
+    # Revert a batch, then resolve it again: removes and inserts alike
+    resolved = [d['id'] for d in db.get_resolved_defects(label)]
+    samples = []
+    for n in range(5):
+        batch = resolved[n * POLL_CHANGES:(n + 1) * POLL_CHANGES]
+        for status in ('OPEN', 'RESOLVED'):
+            db.update_defect_statuses((i, status) for i in batch)
+            start = time.perf_counter()
+            with quiet:
+                seen = agent.poll_once()
+            samples.append((time.perf_counter() - start) * 1000)
+            assert seen == len(batch), seen
+    results[f'poll.tick_{POLL_CHANGES}_changes'] = summarize(samples)
+    doc_generator.forget(label)
+    return results
+
+
+def run_size(db_dir, size, progress):
+    rng = random.Random(size)
+    path = os.path.join(db_dir, f'bench_{size}.db')
+    seconds = seed(path, size, rng)
+    labels = db.get_labels()
+    label = labels[len(labels) // 2]
+    progress(f"[BENCH] {size} defects, {len(labels)} labels"
+             + (f" (seeded in {seconds:.1f} s)" if seconds else " (reused)"))
+
+    results = {}
+    for name, bench in (
+        ('db', lambda: bench_db(label)),
+        ('doc', lambda: bench_docs(label)),
+        ('api', lambda: bench_api(path, size, label)),
+        ('poll', lambda: bench_poller(label)),
+    ):
+        results.update(bench())
+        progress(f"[BENCH]   {name} done")
+    return {'defects': size, 'labels': len(labels), 'label': label, 'metrics': results}
+
+
+# ---------------------------------------------------------------------------
+# Thresholds
+# ---------------------------------------------------------------------------
+def check(report, thresholds):
+    """Return a line per statistic over its limit (lower is better, except rps)."""
+    failures = []
+    for size, limits in thresholds.items():
+        run = report['sizes'].get(size)
+        if run is None:
+            continue
+        for metric, stats in limits.items():
+            measured = run['metrics'].get(metric)
+            if measured is None:
+                failures.append(f"{size}: {metric} missing from results")
+                continue
+            for stat, limit in stats.items():
+                value = measured[stat]
+                worse = value < limit if stat == 'rps' else value > limit
+                if worse:
+                    failures.append(f"{size}: {metric} {stat} = {value} (limit {limit})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Release note agent benchmarks")
+    parser.add_argument("--sizes", default=','.join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated defect counts (default: 1000,100000)")
+    parser.add_argument("--output", metavar="FILE", help="Write JSON results here (default: stdout)")
+    parser.add_argument("--db-dir", metavar="DIR",
+                        help="Keep seeded databases here and reuse them on later runs")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit 1 if any result breaks a regression threshold")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH, metavar="FILE")
+    args = parser.parse_args()
+
+    def progress(line):
+        print(line, file=sys.stderr, flush=True)
+
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix='release-note-bench-')
+    os.makedirs(db_dir, exist_ok=True)
+    doc_generator.DOCS_DIR = tempfile.mkdtemp(prefix='release-note-bench-docs-')
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'sizes': {},
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            report['sizes'][str(size)] = run_size(db_dir, size, progress)
+            db.close_write_queue()
+            db_pool.close_all()
+    finally:
+        shutil.rmtree(doc_generator.DOCS_DIR, ignore_errors=True)
+        if not args.db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    failures = []
+    if args.check:
+        with open(args.thresholds) as f:
+            failures = check(report, json.load(f))
+        report['regressions'] = failures
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for line in failures:
+        print(f"[REGRESSION] {line}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
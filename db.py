@@ -1,93 +1,692 @@
 import sqlite3
 import os
+import queue
+import select
+import socket
+import threading
+import time
+from concurrent.futures import Future
+
+import db_pool
+import metrics
+import profiling
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'defects.db')
 
+# Writers send a datagram here after every commit so a watching agent wakes
+# immediately. If nothing is listening the datagram is simply dropped.
+NOTIFY_ADDR = ('127.0.0.1', int(os.environ.get('RELEASE_NOTE_NOTIFY_PORT', '8765')))
+_notify_sock = None
+
+# Writes from every thread go through one writer thread that commits them in
+# groups: one fsync and one wake-up per group instead of per request.
+# RELEASE_NOTE_WRITE_QUEUE=0 makes each call commit on its own connection.
+WRITE_QUEUE_ENABLED = os.environ.get('RELEASE_NOTE_WRITE_QUEUE', '1') != '0'
+WRITE_WINDOW = float(os.environ.get('RELEASE_NOTE_WRITE_WINDOW_MS', '2')) / 1000
+WRITE_MAX_GROUP = 256
+# PRAGMA synchronous for every write, queued or not: NORMAL survives a crash
+# of the process, FULL (or EXTRA) also survives power loss, OFF trusts the OS.
+DURABILITY_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _durability(value):
+    """Validate a PRAGMA synchronous level; SQLite would quietly use NORMAL."""
+    level = value.upper()
+    if level not in DURABILITY_LEVELS:
+        raise ValueError(f"Unknown durability {value!r} (RELEASE_NOTE_DURABILITY); "
+                         f"expected one of {', '.join(DURABILITY_LEVELS)}")
+    return level
+
+
+WRITE_DURABILITY = _durability(os.environ.get('RELEASE_NOTE_DURABILITY', 'NORMAL'))
+# The change feed keeps its newest CHANGE_RETENTION rows; each commit that may
+# have added changes prunes the rest. Cursors older than that raise
+# CursorExpired, and the caller reloads in full instead.
+CHANGE_RETENTION = int(os.environ.get('RELEASE_NOTE_CHANGE_RETENTION', '100000'))
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+# Stored in PRAGMA user_version once init_db has laid out the schema, so later
+# starts skip the DDL. Bump when the schema below changes.
+SCHEMA_VERSION = 1
+
+RESOLVED_DEFECTS_SQL = (
+    "SELECT * FROM defects WHERE label = ? AND status = 'RESOLVED' ORDER BY id"
+)
+RELEASE_INFO_SQL = "SELECT * FROM release_info WHERE label = ?"
+# Answered from idx_defects_status_id alone; the table itself is never read.
+RESOLVED_IDS_SQL = "SELECT id FROM defects WHERE status = 'RESOLVED' ORDER BY id"
+
+DEFECT_FIELDS = ('id', 'title', 'date', 'developer_comment', 'label', 'status')
+
+
+def _defects_page_sql(label=False, status=False, date_from=False, date_to=False,
+                      limit=False, fields=None):
+    """Build the keyset-paginated defects query for the given filters."""
+    columns = ', '.join(fields) if fields else '*'
+    sql = f"SELECT {columns} FROM defects WHERE id > ?"
+    if label:
+        sql += " AND label = ?"
+    if status:
+        sql += " AND status = ?"
+    if date_from:
+        sql += " AND date >= ?"
+    if date_to:
+        sql += " AND date <= ?"
+    sql += " ORDER BY id"
+    if limit:
+        sql += " LIMIT ?"
+    return sql
+
+CHANGES_SINCE_SQL = "SELECT * FROM defect_changes WHERE seq > ? ORDER BY seq"
+PRUNE_CHANGES_SQL = (
+    "DELETE FROM defect_changes WHERE seq <= (SELECT MAX(seq) FROM defect_changes) - ?"
+)
+
+# Queries on hot paths, with sample parameters. tests/test_db.py asserts via
+# EXPLAIN QUERY PLAN that none of them falls back to a table scan.
+HOT_QUERIES = {
+    'resolved_defects': (RESOLVED_DEFECTS_SQL, ('v1.0',)),
+    'release_info':     (RELEASE_INFO_SQL, ('v1.0',)),
+    'resolved_ids':     (RESOLVED_IDS_SQL, ()),
+    'changes_since':    (CHANGES_SINCE_SQL, (0,)),
+    'prune_changes':    (PRUNE_CHANGES_SQL, (100000,)),
+    'defects_page':     (_defects_page_sql(limit=True), (0, 100)),
+    'defects_page_label': (_defects_page_sql(label=True, limit=True), (0, 'v1.0', 100)),
+    'defects_page_status': (_defects_page_sql(status=True, limit=True), (0, 'OPEN', 100)),
+    'defects_page_label_status': (
+        _defects_page_sql(label=True, status=True, limit=True), (0, 'v1.0', 'OPEN', 100)
+    ),
+}
+
+
+class CursorExpired(Exception):
+    """The changes after a cursor have been pruned from the feed."""
+
+    def __init__(self, cursor, oldest):
+        super().__init__(f"Change cursor {cursor} predates the retained feed "
+                         f"(oldest change is {oldest}); reload in full")
+        self.cursor = cursor
+        self.oldest = oldest
+
+
+def _query(fn):
+    """Time a db function for metrics and, when profiling, the slow-query log."""
+    return profiling.log_slow(metrics.timed('db_query_seconds', query=fn.__name__)(fn))
+
 
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    return conn
+    """Return this thread's pooled connection to DB_PATH."""
+    return db_pool.get_conn(DB_PATH)
+
+
+def notify_change():
+    """Wake any ChangeWatcher listening on NOTIFY_ADDR (best effort)."""
+    global _notify_sock
+    try:
+        if _notify_sock is None:
+            _notify_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _notify_sock.sendto(b'!', NOTIFY_ADDR)
+    except OSError:
+        pass
+
+
+class WriteQueue:
+    """Single writer thread that group-commits writes submitted from any thread.
+
+    ``submit(fn, *args)`` enqueues ``fn(conn, *args)`` and returns a Future.
+    The writer takes the first pending write, waits up to ``window`` seconds
+    for more (at most ``max_group``), then runs them in one transaction. Each
+    write gets its own savepoint, so one failing write is rolled back and
+    reported through its own future without affecting the rest of the group.
+    """
+
+    def __init__(self, window=None, max_group=WRITE_MAX_GROUP, durability=None):
+        self.window = WRITE_WINDOW if window is None else window
+        self.max_group = max_group
+        self.durability = _durability(durability or WRITE_DURABILITY)
+        self.writes = 0
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, notify=True):
+        future = Future()
+        self._queue.put((fn, args, notify, future))
+        return future
+
+    def close(self):
+        """Commit whatever is queued, then stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        group = [first]
+        deadline = time.monotonic() + self.window
+        while len(group) < self.max_group:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 \
+                    else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this group
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        while True:
+            group = self._collect()
+            if group is None:
+                return
+            self._commit(group)
+
+    def _commit(self, group):
+        results = []
+        try:
+            conn = get_conn()
+            conn.execute(f"PRAGMA synchronous={self.durability}")
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, _, future in group:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE write")
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future, None, exc))
+            if any(notify for _, _, notify, _ in group):
+                _prune_changes(conn)
+            conn.commit()
+        except Exception as exc:
+            # The transaction itself failed: nothing in the group was kept.
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            for fn, args, _, future in group:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        self.writes += len(results)
+        self.commits += 1
+        if any(notify for _, _, notify, _ in group):
+            notify_change()
+        for future, result, exc in results:
+            if exc is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exc)
+
+
+def _prune_changes(conn):
+    conn.execute(PRUNE_CHANGES_SQL, (CHANGE_RETENTION,))
+
+
+def _writer():
+    global _write_queue
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = WriteQueue()
+    return _write_queue
+
+
+def close_write_queue():
+    """Flush and stop the shared writer thread; the next write restarts it."""
+    global _write_queue
+    with _write_queue_lock:
+        wq, _write_queue = _write_queue, None
+    if wq is not None:
+        wq.close()
+
+
+def _write(fn, *args, notify=True):
+    """Run ``fn(conn, *args)`` in a write transaction and return its result."""
+    if WRITE_QUEUE_ENABLED:
+        return _writer().submit(fn, *args, notify=notify).result()
+    conn = get_conn()
+    conn.execute(f"PRAGMA synchronous={WRITE_DURABILITY}")
+    with conn:  # pooled connection: roll back on error so it stays usable
+        conn.execute("BEGIN IMMEDIATE")
+        result = fn(conn, *args)
+        if notify:
+            _prune_changes(conn)
+    if notify:
+        notify_change()
+    return result
+
+
+class ChangeWatcher:
+    """Block until the database changes, without a fixed polling timer.
+
+    Writes made through this module (from any process) wake the watcher via a
+    datagram on NOTIFY_ADDR. Writers that bypass it are caught by checking
+    ``PRAGMA data_version``, backing off from ``min_wait`` to ``max_wait``
+    seconds while the database stays idle.
+    """
+
+    def __init__(self, addr=None, min_wait=0.005, max_wait=1.0):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self._backoff = min_wait
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self._sock.bind(addr or NOTIFY_ADDR)
+        except OSError:
+            # Another watcher owns the port — fall back to data_version only.
+            self._sock.close()
+            self._sock = None
+        self._conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        self._version = self._data_version()
+
+    @property
+    def address(self):
+        return self._sock.getsockname() if self._sock else None
+
+    def _data_version(self):
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _drain(self):
+        self._sock.setblocking(False)
+        try:
+            while True:
+                self._sock.recv(64)
+        except OSError:
+            pass
+        finally:
+            self._sock.setblocking(True)
+
+    def wait(self, timeout):
+        """Return True as soon as a change is seen, False after ``timeout`` s."""
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self._data_version()
+            if version != self._version:
+                self._version = version
+                self._backoff = self.min_wait
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            step = min(self._backoff, remaining)
+            if self._sock is not None:
+                readable, _, _ = select.select([self._sock], [], [], step)
+                if readable:
+                    self._drain()
+                    self._version = self._data_version()
+                    self._backoff = self.min_wait
+                    return True
+            else:
+                time.sleep(step)
+            self._backoff = min(self._backoff * 2, self.max_wait)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._conn.close()
 
 
 def init_db():
+    """Create the schema; a no-op beyond one PRAGMA read once it is current."""
     conn = get_conn()
-    try:
-        conn.executescript("""
-            CREATE TABLE IF NOT EXISTS defects (
-                id                INTEGER PRIMARY KEY AUTOINCREMENT,
-                title             TEXT    NOT NULL,
-                date              TEXT    NOT NULL,
-                developer_comment TEXT    DEFAULT '',
-                label             TEXT    NOT NULL,
-                status            TEXT    NOT NULL CHECK(status IN ('OPEN','RESOLVED'))
-            );
-            CREATE TABLE IF NOT EXISTS release_info (
-                id         INTEGER PRIMARY KEY AUTOINCREMENT,
-                label      TEXT    NOT NULL UNIQUE,
-                build_no   TEXT    NOT NULL,
-                created_at TEXT    NOT NULL
-            );
-        """)
-        conn.commit()
-    finally:
-        conn.close()
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS defects (
+            id                INTEGER PRIMARY KEY AUTOINCREMENT,
+            title             TEXT    NOT NULL,
+            date              TEXT    NOT NULL,
+            developer_comment TEXT    DEFAULT '',
+            label             TEXT    NOT NULL,
+            status            TEXT    NOT NULL CHECK(status IN ('OPEN','RESOLVED'))
+        );
+        CREATE TABLE IF NOT EXISTS release_info (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            label      TEXT    NOT NULL UNIQUE,
+            build_no   TEXT    NOT NULL,
+            created_at TEXT    NOT NULL
+        );
+
+        -- Change feed: one row per create / status change, in commit order.
+        CREATE TABLE IF NOT EXISTS defect_changes (
+            seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+            defect_id INTEGER NOT NULL,
+            label     TEXT    NOT NULL,
+            status    TEXT    NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS defects_change_on_insert
+        AFTER INSERT ON defects
+        BEGIN
+            INSERT INTO defect_changes (defect_id, label, status)
+            VALUES (NEW.id, NEW.label, NEW.status);
+        END;
+        CREATE TRIGGER IF NOT EXISTS defects_change_on_status
+        AFTER UPDATE OF status ON defects
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            INSERT INTO defect_changes (defect_id, label, status)
+            VALUES (NEW.id, NEW.label, NEW.status);
+        END;
+
+        -- Fingerprint of the inputs behind each label's last written .docx
+        CREATE TABLE IF NOT EXISTS doc_fingerprints (
+            label       TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            updated_at  TEXT NOT NULL
+        );
+
+        -- Serves get_resolved_defects: equality on (label, status), rows
+        -- already in id order, so no scan and no sort.
+        CREATE INDEX IF NOT EXISTS idx_defects_label_status
+            ON defects (label, status, id);
+        -- Keyset pages filtered by label or status alone, already in id order.
+        CREATE INDEX IF NOT EXISTS idx_defects_label_id
+            ON defects (label, id);
+        CREATE INDEX IF NOT EXISTS idx_defects_status_id
+            ON defects (status, id);
+    """)
+    # Databases created before the change feed existed: seed it with the
+    # current state of every defect so cursor 0 means "everything".
+    with conn:
+        conn.execute(
+            "INSERT INTO defect_changes (defect_id, label, status) "
+            "SELECT id, label, status FROM defects "
+            "WHERE NOT EXISTS (SELECT 1 FROM defect_changes) ORDER BY id"
+        )
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
 
+@_query
 def get_all_defects():
     conn = get_conn()
-    try:
-        rows = conn.execute("SELECT * FROM defects ORDER BY id").fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        conn.close()
+    rows = conn.execute("SELECT * FROM defects ORDER BY id").fetchall()
+    return [dict(row) for row in rows]
+
+
+@_query
+def get_labels():
+    """Return every label that has at least one defect, sorted."""
+    conn = get_conn()
+    rows = conn.execute("SELECT DISTINCT label FROM defects ORDER BY label").fetchall()
+    return [row[0] for row in rows]
+
+
+@_query
+def query_defects(after_id=0, limit=None, label=None, status=None,
+                  date_from=None, date_to=None, fields=None):
+    """Return one keyset page of defects with id > after_id, ordered by id.
 
+    Filters are optional; ``fields`` restricts the returned columns (``id`` is
+    always included so callers can ask for the next page). Raises ValueError
+    for unknown fields.
+    """
+    if fields:
+        unknown = [f for f in fields if f not in DEFECT_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        fields = ['id'] + [f for f in DEFECT_FIELDS if f in fields and f != 'id']
+    sql = _defects_page_sql(
+        label=label is not None, status=status is not None,
+        date_from=date_from is not None, date_to=date_to is not None,
+        limit=limit is not None, fields=fields,
+    )
+    params = [after_id]
+    params += [p for p in (label, status, date_from, date_to, limit) if p is not None]
+    rows = get_conn().execute(sql, params).fetchall()
+    return [dict(row) for row in rows]
 
+
+@_query
 def get_resolved_defects(label):
     conn = get_conn()
+    rows = conn.execute(RESOLVED_DEFECTS_SQL, (label,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def iter_resolved_defects(label, batch_size=1000):
+    """Yield RESOLVED defects for ``label`` as sqlite3.Row objects, in id order.
+
+    Rows are fetched ``batch_size`` at a time, so memory stays bounded no
+    matter how many defects the label has.
+    """
+    cursor = get_conn().execute(RESOLVED_DEFECTS_SQL, (label,))
     try:
-        rows = conn.execute(
-            "SELECT * FROM defects WHERE label = ? AND status = 'RESOLVED' ORDER BY id",
-            (label,)
-        ).fetchall()
-        return [dict(row) for row in rows]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
     finally:
-        conn.close()
+        cursor.close()
 
 
-def get_release_info(label):
+def iter_resolved_ids(batch_size=10000):
+    """Yield the id of every RESOLVED defect, in id order, as plain ints.
+
+    Only the id column is read, from a covering index, ``batch_size`` rows at
+    a time, so this stays cheap even at millions of defects.
+    """
     conn = get_conn()
+    cursor = conn.execute(RESOLVED_IDS_SQL)
     try:
-        row = conn.execute(
-            "SELECT * FROM release_info WHERE label = ?", (label,)
-        ).fetchone()
-        return dict(row) if row else None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0]
     finally:
-        conn.close()
+        cursor.close()
 
 
-def create_defect(title, date, developer_comment, label, status):
+@_query
+def get_defects_by_ids(ids):
+    """Return the defects with the given ids, ordered by id."""
+    ids = list(ids)
     conn = get_conn()
-    try:
-        cursor = conn.execute(
-            "INSERT INTO defects (title, date, developer_comment, label, status) "
-            "VALUES (?, ?, ?, ?, ?)",
-            (title, date, developer_comment or '', label, status)
-        )
-        conn.commit()
-        return cursor.lastrowid
-    finally:
-        conn.close()
+    rows = []
+    for i in range(0, len(ids), 500):  # stay under SQLite's variable limit
+        chunk = ids[i:i + 500]
+        placeholders = ', '.join('?' * len(chunk))
+        rows += conn.execute(
+            f"SELECT * FROM defects WHERE id IN ({placeholders})", chunk
+        ).fetchall()
+    return sorted((dict(row) for row in rows), key=lambda d: d['id'])
 
 
-def update_defect_status(defect_id, status):
+@_query
+def get_defect(defect_id):
     conn = get_conn()
-    try:
-        conn.execute(
-            "UPDATE defects SET status = ? WHERE id = ?",
-            (status, defect_id)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    row = conn.execute("SELECT * FROM defects WHERE id = ?", (defect_id,)).fetchone()
+    return dict(row) if row else None
+
+
+@_query
+def get_release_info(label):
+    conn = get_conn()
+    row = conn.execute(RELEASE_INFO_SQL, (label,)).fetchone()
+    return dict(row) if row else None
+
+
+@_query
+def get_change_cursor():
+    """Return the sequence number of the latest recorded change (0 if none)."""
+    conn = get_conn()
+    row = conn.execute("SELECT MAX(seq) FROM defect_changes").fetchone()
+    return row[0] or 0
+
+
+@_query
+def get_changes_since(cursor, limit=None):
+    """Return changes with seq > cursor, oldest first.
+
+    Each change is a dict with ``seq``, ``defect_id``, ``label`` and ``status``
+    (the status the defect was created with or moved to). The cost is
+    proportional to the number of changes, not the size of ``defects``.
+    Raises CursorExpired when changes after ``cursor`` have been pruned.
+    """
+    conn = get_conn()
+    sql = CHANGES_SINCE_SQL
+    params = (cursor,)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params += (limit,)
+    rows = conn.execute(sql, params).fetchall()
+    # seq only ever grows and nothing but pruning deletes from the feed, so a
+    # gap right after the cursor means the rows it needed are gone.
+    if rows and rows[0]['seq'] > cursor + 1:
+        raise CursorExpired(cursor, rows[0]['seq'])
+    return [dict(row) for row in rows]
+
+
+@_query
+def get_doc_fingerprint(label):
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT fingerprint FROM doc_fingerprints WHERE label = ?", (label,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _set_doc_fingerprint(conn, label, fingerprint):
+    conn.execute(
+        "INSERT INTO doc_fingerprints (label, fingerprint, updated_at) "
+        "VALUES (?, ?, datetime('now')) "
+        "ON CONFLICT(label) DO UPDATE SET "
+        "fingerprint = excluded.fingerprint, updated_at = excluded.updated_at",
+        (label, fingerprint)
+    )
+
+
+@_query
+def set_doc_fingerprint(label, fingerprint):
+    _write(_set_doc_fingerprint, label, fingerprint, notify=False)
+
+
+def _clear_doc_fingerprint(conn, label):
+    conn.execute("DELETE FROM doc_fingerprints WHERE label = ?", (label,))
+
+
+@_query
+def clear_doc_fingerprint(label):
+    _write(_clear_doc_fingerprint, label, notify=False)
+
+
+@_query
+def get_defects_changed_since(cursor, limit=1000):
+    """Return (defects, new_cursor, more) for rows created or modified after ``cursor``.
+
+    At most ``limit`` changes are consumed per call; ``more`` is True when
+    further changes remain past ``new_cursor``. Each defect appears once, in
+    its current state, ordered by its latest change. Raises CursorExpired
+    when changes after ``cursor`` have been pruned.
+    """
+    conn = get_conn()
+    latest, oldest = conn.execute(
+        "SELECT (SELECT MAX(seq) FROM defect_changes), (SELECT MIN(seq) FROM defect_changes)"
+    ).fetchone()
+    latest = latest or 0
+    if oldest is not None and cursor < oldest - 1:
+        raise CursorExpired(cursor, oldest)
+    row = conn.execute(
+        "SELECT seq FROM defect_changes WHERE seq > ? ORDER BY seq LIMIT 1 OFFSET ?",
+        (cursor, limit - 1)
+    ).fetchone()
+    new_cursor = min(row[0], latest) if row else latest
+    if new_cursor <= cursor:
+        return [], cursor, False
+    rows = conn.execute(
+        "SELECT d.* FROM defects d JOIN ("
+        "  SELECT defect_id, MAX(seq) AS seq FROM defect_changes"
+        "  WHERE seq > ? AND seq <= ? GROUP BY defect_id"
+        ") c ON d.id = c.defect_id ORDER BY c.seq",
+        (cursor, new_cursor)
+    ).fetchall()
+    return [dict(r) for r in rows], new_cursor, new_cursor < latest
+
+
+def query_plan(sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for ``sql``."""
+    conn = get_conn()
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    return [row['detail'] for row in rows]
+
+
+def _insert_defect(conn, title, date, developer_comment, label, status):
+    cursor = conn.execute(
+        "INSERT INTO defects (title, date, developer_comment, label, status) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (title, date, developer_comment or '', label, status)
+    )
+    return cursor.lastrowid
+
+
+@_query
+def create_defect(title, date, developer_comment, label, status):
+    return _write(_insert_defect, title, date, developer_comment, label, status)
+
+
+def _insert_defects(conn, rows):
+    # Runs under the write lock, so no other writer can interleave ids
+    # between the high-water mark and our inserts.
+    before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM defects").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO defects (title, date, developer_comment, label, status) "
+        "VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    return [row[0] for row in conn.execute(
+        "SELECT id FROM defects WHERE id > ? ORDER BY id", (before,)
+    )]
+
+
+@_query
+def create_defects(defects):
+    """Insert many defects in one transaction; return their ids in order.
+
+    ``defects`` is an iterable of dicts with the same keys create_defect
+    takes. Either every row is inserted or none is.
+    """
+    rows = [
+        (d.get('title', ''), d.get('date', ''), d.get('developer_comment') or '',
+         d.get('label', ''), d.get('status', 'OPEN'))
+        for d in defects
+    ]
+    if not rows:
+        return []
+    return _write(_insert_defects, rows)
+
+
+def _update_statuses(conn, updates):
+    return conn.executemany(
+        "UPDATE defects SET status = ? WHERE id = ?", updates
+    ).rowcount
+
+
+@_query
+def update_defect_statuses(updates):
+    """Apply many ``(defect_id, status)`` pairs in one transaction.
+
+    Returns the number of defects matched.
+    """
+    updates = [(status, defect_id) for defect_id, status in updates]
+    if not updates:
+        return 0
+    return _write(_update_statuses, updates)
+
+
+@_query
+def update_defect_status(defect_id, status):
+    _write(_update_statuses, [(status, defect_id)])
@@ -0,0 +1,75 @@
+"""
+Thread-aware SQLite connection pool.
+
+Each thread gets one long-lived connection per database file. Pragmas are
+applied once, when that connection is opened, and sqlite3's per-connection
+statement cache keeps prepared statements alive between calls.
+"""
+import sqlite3
+import threading
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",   # 256 MiB
+    "PRAGMA cache_size=-16384",     # 16 MiB
+)
+CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+
+    def __init__(self, pragmas=PRAGMAS, cached_statements=CACHED_STATEMENTS):
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = []
+        self._generation = 0
+
+    def connection(self, path):
+        """Return this thread's connection to ``path``, opening it on first use."""
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            local.conns = {}
+            local.generation = self._generation
+
+        conn = local.conns.get(path)
+        if conn is None:
+            conn = self._connect(path)
+            local.conns[path] = conn
+            with self._lock:
+                self._open.append(conn)
+        return conn
+
+    def _connect(self, path):
+        # check_same_thread=False only so close_all() can run from any thread;
+        # each connection is otherwise used by the thread that opened it.
+        conn = sqlite3.connect(
+            path,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def close_all(self):
+        """Close every pooled connection; threads reconnect on next use."""
+        with self._lock:
+            conns, self._open = self._open, []
+            self._generation += 1
+        for conn in conns:
+            conn.close()
+
+
+_pool = ConnectionPool()
+
+
+def get_conn(path):
+    return _pool.connection(path)
+
+
+def close_all():
+    _pool.close_all()
@@ -1,63 +1,527 @@
+import copy
+import hashlib
+import io
+import multiprocessing
 import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from docx import Document
-from docx.shared import Pt
+from xml.sax.saxutils import escape
 import db
+import metrics
+import profiling
 
 DOCS_DIR = os.path.dirname(os.path.abspath(__file__))
 
+HEADERS = ['ID', 'Title', 'Date', 'Developer Comment']
+
+# 'docx' builds the table through python-docx; 'fast' streams the table rows
+# straight into word/document.xml with bounded memory.
+BACKENDS = ('docx', 'fast')
+DEFAULT_BACKEND = 'docx'
+
+# Bump when the generated layout changes so stored fingerprints stop matching.
+FINGERPRINT_VERSION = 1
+
+# Optional .docx whose styles, page setup and leading content every release
+# note is built on. Loaded once per process and cached like the default.
+TEMPLATE_PATH = None
+
+_skeletons = {}  # template path (None = python-docx default) -> (Document, heading index)
+_skeleton_lock = threading.Lock()
+
+_label_locks = {}  # label -> Lock serialising writes to that label's file
+_label_locks_guard = threading.Lock()
+
+_CELL_MARKER = '@@CELL{}@@'
+_CELL_SLOT = re.compile(r'<w:r><w:t>@@CELL(\d)@@</w:t></w:r>')
+_RUN_SPLIT = re.compile(r'(\t|\r|\n)')
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_STREAM_CHUNK_ROWS = 1000
+
+# label -> LiveDoc for every document this process has built or patched
+_live_docs = {}
+
 
 def _doc_path(label):
     return os.path.join(DOCS_DIR, f"release_notes_{label}.docx")
 
 
-def create_doc(label):
-    defects = db.get_resolved_defects(label)
-    release_info = db.get_release_info(label)
+def label_lock(label):
+    """Return the lock guarding writes to ``label``'s document."""
+    with _label_locks_guard:
+        lock = _label_locks.get(label)
+        if lock is None:
+            lock = _label_locks[label] = threading.Lock()
+        return lock
+
+
+def _fill_row(cells, defect):
+    cells[0].text = str(defect['id'])
+    cells[1].text = defect['title']
+    cells[2].text = defect['date']
+    cells[3].text = defect.get('developer_comment', '')
+
+
+def _skeleton(template=None):
+    """Return a fresh copy of the static document skeleton for ``template``.
+
+    The heading, metadata paragraph, 'Table Grid' table and bold header row
+    are laid out once per process; each call only deep-copies the result.
+    Returns (doc, heading paragraph, metadata paragraph, table).
+    """
+    key = template or TEMPLATE_PATH
+    with _skeleton_lock:
+        cached = _skeletons.get(key)
+        if cached is None:
+            from docx import Document  # python-docx + lxml: only when a doc is built
+            doc = Document(key)
+            heading_index = len(doc.paragraphs)
+            doc.add_heading('', level=1)
+            doc.add_paragraph('')
+
+            # 4-column table
+            table = doc.add_table(rows=1, cols=4)
+            table.style = 'Table Grid'
+
+            # Header row (bold)
+            hdr_cells = table.rows[0].cells
+            for i, header in enumerate(HEADERS):
+                hdr_cells[i].text = header
+                hdr_cells[i].paragraphs[0].runs[0].bold = True
+
+            cached = _skeletons[key] = (doc, heading_index)
+
+    skeleton, heading_index = cached
+    # lxml's __deepcopy__ ignores the memo, so the copied Document's own
+    # element is a stray duplicate; rebind to the copied part's element.
+    doc = copy.deepcopy(skeleton).part.document
+    paragraphs = doc.paragraphs
+    return doc, paragraphs[heading_index], paragraphs[heading_index + 1], doc.tables[-1]
+
 
-    doc = Document()
+def _build_doc(label, defects, release_info, template=None):
+    doc, heading, metadata, table = _skeleton(template)
 
     # Title heading
-    doc.add_heading(f'Release Notes — {label}', level=1)
+    heading.text = f'Release Notes — {label}'
 
     # Metadata line
     build_no = release_info['build_no'] if release_info else 'N/A'
     generated_date = datetime.now().strftime('%Y-%m-%d')
-    doc.add_paragraph(f'Build: {build_no}  |  Generated: {generated_date}')
+    metadata.text = f'Build: {build_no}  |  Generated: {generated_date}'
 
-    # 4-column table
-    table = doc.add_table(rows=1, cols=4)
-    table.style = 'Table Grid'
+    # Data rows
+    for defect in defects:
+        _fill_row(table.add_row().cells, defect)
 
-    # Header row (bold)
-    hdr_cells = table.rows[0].cells
-    for i, header in enumerate(['ID', 'Title', 'Date', 'Developer Comment']):
-        hdr_cells[i].text = header
-        hdr_cells[i].paragraphs[0].runs[0].bold = True
+    return doc
 
-    # Data rows
+
+def _run_xml(text):
+    """Serialise ``text`` as a <w:r> exactly like python-docx's ``run.text = text``."""
+    if _XML_INVALID.search(text):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, '
+                         'no NULL bytes or control characters')
+    if not text:
+        return '<w:r/>'
+    parts = ['<w:r>']
+    for piece in _RUN_SPLIT.split(text):
+        if piece == '\t':
+            parts.append('<w:tab/>')
+        elif piece in ('\r', '\n'):
+            parts.append('<w:br/>')
+        elif piece:
+            space = ' xml:space="preserve"' if piece.strip() != piece else ''
+            parts.append(f'<w:t{space}>{escape(piece)}</w:t>')
+    parts.append('</w:r>')
+    return ''.join(parts)
+
+
+def _stream_skeleton(label, release_info, template=None):
+    """Return (docx bytes, document.xml head, row parts, document.xml tail).
+
+    The skeleton is the python-docx document with one placeholder data row;
+    splitting its XML around that row yields the exact markup each streamed
+    row must reproduce.
+    """
+    placeholder = {'id': _CELL_MARKER.format(0), 'title': _CELL_MARKER.format(1),
+                   'date': _CELL_MARKER.format(2), 'developer_comment': _CELL_MARKER.format(3)}
+    buf = io.BytesIO()
+    _build_doc(label, [placeholder], release_info, template).save(buf)
+    package = buf.getvalue()
+    with zipfile.ZipFile(io.BytesIO(package)) as zin:
+        xml = zin.read('word/document.xml').decode('utf-8')
+    row_start = xml.rindex('<w:tr>', 0, xml.index(_CELL_MARKER.format(0)))
+    row_end = xml.index('</w:tr>', row_start) + len('</w:tr>')
+    row_parts = _CELL_SLOT.split(xml[row_start:row_end])
+    return package, xml[:row_start], row_parts, xml[row_end:]
+
+
+def _stream_doc(label, path, release_info, template=None, hasher=None):
+    """Stream ``label``'s RESOLVED rows into ``path``, feeding each to ``hasher`` if given."""
+    package, head, row_parts, tail = _stream_skeleton(label, release_info, template)
+    # row_parts alternates literal XML and cell indexes: [xml, '0', xml, '1', ...]
+    literals, slots = row_parts[::2], [int(i) for i in row_parts[1::2]]
+    columns = ('id', 'title', 'date', 'developer_comment')
+
+    tmp_path = path + '.tmp'
+    try:
+        with zipfile.ZipFile(io.BytesIO(package)) as zin, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename != 'word/document.xml':
+                    zout.writestr(info, zin.read(info.filename))
+                    continue
+                with zout.open(info, 'w') as fh:
+                    fh.write(head.encode('utf-8'))
+                    chunk = []
+                    for defect in db.iter_resolved_defects(label):
+                        if hasher is not None:
+                            _hash_defect(hasher, defect)
+                        values = (str(defect['id']), defect['title'], defect['date'],
+                                  defect['developer_comment'] or '')
+                        row = [literals[0]]
+                        for slot, literal in zip(slots, literals[1:]):
+                            row.append(_run_xml(values[slot]))
+                            row.append(literal)
+                        chunk.append(''.join(row))
+                        if len(chunk) >= _STREAM_CHUNK_ROWS:
+                            fh.write(''.join(chunk).encode('utf-8'))
+                            chunk.clear()
+                    fh.write(''.join(chunk).encode('utf-8'))
+                    fh.write(tail.encode('utf-8'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Never leave a partial file behind, however the write was interrupted
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return path
+
+
+class LiveDoc:
+    """In-memory model of one label's release-note table.
+
+    Row inserts and removals are applied to the loaded document as deltas,
+    keeping rows in id order; nothing touches disk until save().
+    """
+
+    def __init__(self, label, doc, ids=None):
+        self.label = label
+        self.doc = doc
+        self.table = doc.tables[-1]  # a template may bring tables of its own
+        self._trs = self.table._tbl.tr_lst[1:]
+        if ids is None:
+            ids = [int(row.cells[0].text) for row in self.table.rows[1:]]
+        self._ids = list(ids)
+        self.mtime = None  # mtime of the file this model matches, if any
+
+    @classmethod
+    def load(cls, label):
+        """Load the saved document for ``label``, or return None if there is none."""
+        path = _doc_path(label)
+        if not os.path.exists(path):
+            return None
+        from docx import Document
+        doc = cls(label, Document(path))
+        doc.mtime = os.stat(path).st_mtime_ns
+        return doc
+
+    def remove(self, defect_id):
+        i = bisect_left(self._ids, defect_id)
+        if i < len(self._ids) and self._ids[i] == defect_id:
+            self.table._tbl.remove(self._trs[i])
+            del self._ids[i]
+            del self._trs[i]
+            return True
+        return False
+
+    def insert(self, defect):
+        defect_id = defect['id']
+        self.remove(defect_id)
+        row = self.table.add_row()  # appended last; moved into id order below
+        _fill_row(row.cells, defect)
+        i = bisect_left(self._ids, defect_id)
+        if i < len(self._trs):
+            self._trs[i].addprevious(row._tr)
+        self._ids.insert(i, defect_id)
+        self._trs.insert(i, row._tr)
+
+    def save(self):
+        path = _doc_path(self.label)
+        with metrics.timer('doc_seconds', op='save'):
+            self.doc.save(path)
+        self.mtime = os.stat(path).st_mtime_ns
+        return path
+
+
+def live_doc(label):
+    """Return the cached LiveDoc for ``label``, loading it from disk if needed."""
+    doc = _live_docs.get(label)
+    if doc is not None:
+        try:
+            stale = os.stat(_doc_path(label)).st_mtime_ns != doc.mtime
+        except FileNotFoundError:
+            stale = True
+        if stale:  # rewritten or deleted behind our back
+            doc = None
+    if doc is None:
+        doc = LiveDoc.load(label)
+        if doc is not None:
+            _live_docs[label] = doc
+        else:
+            _live_docs.pop(label, None)
+    return doc
+
+
+@metrics.timed('doc_seconds', op='patch')
+def apply_changes(label, removed=(), added=()):
+    """Patch the live document for ``label`` and save it once.
+
+    ``removed`` is an iterable of defect ids, ``added`` of defect dicts as
+    returned by db. Returns the saved path, or None if no document exists
+    for the label yet.
+    """
+    doc = live_doc(label)
+    if doc is None:
+        return None
+    changed = False
+    for defect_id in removed:
+        changed |= doc.remove(defect_id)
+    for defect in added:
+        doc.insert(defect)
+        changed = True
+    if not changed:
+        return _doc_path(label)
+    # A patched file was not produced by create_doc; make its next call rebuild.
+    db.clear_doc_fingerprint(label)
+    return doc.save()
+
+
+class WriteScheduler:
+    """Coalesce live-document patches and write each label once per window.
+
+    Changes submitted for a label are merged (the latest operation per defect
+    wins) and applied with a single apply_changes() call ``window`` seconds
+    after the first of them arrived. ``window=0`` writes synchronously.
+    Each write holds that label's label_lock(), and
+    ``on_write(label, path, removed, added, time_to_doc_ms)`` is called after it.
+    """
+
+    def __init__(self, window=0.25, on_write=None):
+        self.window = window
+        self.on_write = on_write
+        self._cond = threading.Condition()
+        self._pending = {}  # label -> (first_submit_time, {defect_id: defect dict | None})
+        self._closed = False
+        self._stats = {'writes': 0, 'changes': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+        self._thread = None
+        if window > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="doc-writer")
+            self._thread.start()
+
+    def submit(self, label, removed=(), added=()):
+        with self._cond:
+            first, ops = self._pending.setdefault(label, (time.monotonic(), {}))
+            for defect_id in removed:
+                ops[defect_id] = None
+            for defect in added:
+                ops[defect['id']] = defect
+            self._cond.notify()
+        if self._thread is None:
+            self.flush(label)
+
+    def flush(self, label=None):
+        """Write pending changes now — for ``label``, or for every label."""
+        with self._cond:
+            labels = [label] if label is not None else list(self._pending)
+            batches = [(lbl, self._pending.pop(lbl)) for lbl in labels if lbl in self._pending]
+        for lbl, batch in batches:
+            self._write(lbl, *batch)
+
+    def _write(self, label, first, ops):
+        removed = [i for i, defect in ops.items() if defect is None]
+        added = sorted((d for d in ops.values() if d is not None), key=lambda d: d['id'])
+        with label_lock(label):
+            path = apply_changes(label, removed=removed, added=added)
+        elapsed_ms = (time.monotonic() - first) * 1000
+        with self._cond:
+            stats = self._stats
+            stats['writes'] += 1
+            stats['changes'] += len(ops)
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['last_ms'] = elapsed_ms
+        if self.on_write:
+            self.on_write(label, path, removed, added, elapsed_ms)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    due = [lbl for lbl, (first, _) in self._pending.items()
+                           if now - first >= self.window]
+                    if due:
+                        break
+                    timeout = None
+                    if self._pending:
+                        oldest = min(first for first, _ in self._pending.values())
+                        timeout = oldest + self.window - now
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+            for lbl in due:
+                try:
+                    self.flush(lbl)
+                except Exception as exc:  # keep the writer alive for other labels
+                    print(f"[DOC WRITE ERROR] {lbl}: {exc}", file=sys.stderr, flush=True)
+
+    def metrics(self):
+        """Return write counts and time-to-doc figures (ms since first change)."""
+        with self._cond:
+            stats = dict(self._stats)
+        stats['avg_ms'] = stats['total_ms'] / stats['writes'] if stats['writes'] else 0.0
+        stats['pending_labels'] = len(self._pending)
+        return stats
+
+    def close(self):
+        """Stop the writer thread and write anything still pending."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+def forget(label):
+    """Drop the cached model for ``label`` (e.g. after the file was rewritten elsewhere)."""
+    _live_docs.pop(label, None)
+
+
+def _fingerprint_hash(release_info, template):
+    """Start the fingerprint hash; feed it each defect with _hash_defect."""
+    h = hashlib.sha256()
+    build_no = release_info['build_no'] if release_info else 'N/A'
+    h.update(f'{FINGERPRINT_VERSION}\x1e{build_no}\x1e{template or ""}\x1e'.encode('utf-8'))
+    return h
+
+
+def _hash_defect(h, defect):
+    h.update('\x1f'.join((
+        str(defect['id']), defect['title'], defect['date'],
+        defect['developer_comment'] or '',
+    )).encode('utf-8'))
+    h.update(b'\x1e')
+
+
+def _fingerprint(defects, release_info, template):
+    """Hash everything a generated document depends on, bar the generation date."""
+    h = _fingerprint_hash(release_info, template)
     for defect in defects:
-        row_cells = table.add_row().cells
-        row_cells[0].text = str(defect['id'])
-        row_cells[1].text = defect['title']
-        row_cells[2].text = defect['date']
-        row_cells[3].text = defect.get('developer_comment', '')
+        _hash_defect(h, defect)
+    return h.hexdigest()
+
 
+@profiling.profiled('generate')
+def create_doc(label, backend=None, template=None, force=False):
+    """Write release_notes_<label>.docx and return its path.
+
+    Nothing is written when the resolved rows, build number and template
+    match the fingerprint recorded for the last write, unless ``force`` is set.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown doc backend {backend!r}; expected one of {BACKENDS}")
+    template = template or TEMPLATE_PATH
+    start = time.perf_counter()
+    release_info = db.get_release_info(label)
     path = _doc_path(label)
-    doc.save(path)
+
+    defects = None if backend == 'fast' else db.get_resolved_defects(label)
+    if not force and os.path.exists(path):
+        # 'fast' hashes in a separate streaming pass so memory stays bounded.
+        rows = db.iter_resolved_defects(label) if defects is None else defects
+        if db.get_doc_fingerprint(label) == _fingerprint(rows, release_info, template):
+            metrics.inc('doc_skipped_total', backend=backend)
+            return path
+
+    if backend == 'fast':
+        # No in-memory model is kept; it is loaded from disk on the next patch.
+        _live_docs.pop(label, None)
+        # Rows may have changed since the check above: store the hash of the
+        # rows actually streamed into the file.
+        h = _fingerprint_hash(release_info, template)
+        _stream_doc(label, path, release_info, template, hasher=h)
+        fingerprint = h.hexdigest()
+    else:
+        fingerprint = _fingerprint(defects, release_info, template)
+        doc = _build_doc(label, defects, release_info, template)
+        live = LiveDoc(label, doc, ids=[d['id'] for d in defects])
+        _live_docs[label] = live
+        live.save()
+
+    db.set_doc_fingerprint(label, fingerprint)
+    metrics.observe('doc_seconds', time.perf_counter() - start, op='generate', backend=backend)
     return path
 
 
-def remove_row(label, defect_id):
-    path = _doc_path(label)
-    if not os.path.exists(path):
-        return
+def _init_worker(db_path, docs_dir, template_path, default_backend, profile_config):
+    global DOCS_DIR, TEMPLATE_PATH, DEFAULT_BACKEND
+    db.DB_PATH = db_path
+    DOCS_DIR = docs_dir
+    TEMPLATE_PATH = template_path
+    DEFAULT_BACKEND = default_backend
+    if profile_config is not None:
+        profiling.enable(*profile_config)
 
-    doc = Document(path)
-    for table in doc.tables:
-        for row in table.rows:
-            if row.cells[0].text == str(defect_id):
-                table._tbl.remove(row._tr)
-                break
 
-    doc.save(path)
+def create_docs(labels, workers=None, backend=None, template=None, force=False):
+    """Generate release notes for many labels concurrently on a process pool.
+
+    Each label's lock is held from submission until its worker finishes, so
+    generation never overlaps a live patch of the same file. Returns
+    {label: path or the exception raised for that label}.
+    """
+    labels = list(dict.fromkeys(labels))  # a label twice would deadlock on its lock
+    results = {}
+    # spawn, not fork: the parent may hold pooled connections and threads.
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(db.DB_PATH, DOCS_DIR, TEMPLATE_PATH, DEFAULT_BACKEND, profiling.config()),
+    ) as pool:
+        futures = {}
+        for label in labels:
+            lock = label_lock(label)
+            lock.acquire()
+            try:
+                future = pool.submit(create_doc, label, backend, template, force)
+            except BaseException:
+                lock.release()
+                raise
+            future.add_done_callback(lambda _f, lock=lock: lock.release())
+            futures[future] = label
+        for future in as_completed(futures):
+            label = futures[future]
+            _live_docs.pop(label, None)  # rewritten by another process
+            try:
+                results[label] = future.result()
+            except Exception as exc:
+                results[label] = exc
+    return results
+
+
+def remove_row(label, defect_id):
+    apply_changes(label, removed=[defect_id])
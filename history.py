@@ -0,0 +1,189 @@
+"""
+Bounded conversation history for the agent loop.
+
+ConversationHistory keeps the messages sent to Claude under a token budget.
+When a turn pushes it over, the oldest whole turns (a user message and every
+reply up to the next user message) are folded into a running summary — or
+simply dropped when no summarizer is configured — until the history is back
+under ``target`` tokens. Compacting well below the budget means the prefix
+stays unchanged for several turns, so prompt caching keeps paying off.
+
+The static system prompt and the history prefix are marked with
+``cache_control`` so repeated requests read them from the prompt cache.
+"""
+import inspect
+import json
+
+CACHE = {'type': 'ephemeral'}
+
+SUMMARY_PROMPT = """\
+Summarize this conversation between a user and a release note assistant in a
+few sentences. Keep labels, defect ids and decisions; drop pleasantries.
+"""
+
+
+def _content_chars(content) -> int:
+    if isinstance(content, str):
+        return len(content)
+    return len(json.dumps(content, default=str))
+
+
+def _is_turn_start(message: dict) -> bool:
+    """A user message that isn't only carrying tool results back."""
+    if message['role'] != 'user':
+        return False
+    content = message['content']
+    if isinstance(content, str):
+        return True
+    return not any(
+        isinstance(block, dict) and block.get('type') == 'tool_result' for block in content
+    )
+
+
+def _as_blocks(content) -> list:
+    if isinstance(content, str):
+        return [{'type': 'text', 'text': content}]
+    return [dict(block) if isinstance(block, dict) else block for block in content]
+
+
+def _transcript(messages: list[dict]) -> str:
+    lines = []
+    for message in messages:
+        content = message['content']
+        if not isinstance(content, str):
+            content = ' '.join(
+                block.get('text', '') if isinstance(block, dict) else str(block)
+                for block in content
+            )
+        if content.strip():
+            lines.append(f"{message['role']}: {content.strip()}")
+    return '\n'.join(lines)
+
+
+def client_summarizer(client, model: str, max_tokens: int = 300):
+    """Return an async ``summarize`` callable backed by an AsyncAnthropic client."""
+    async def summarize(transcript: str) -> str:
+        response = await client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            system=SUMMARY_PROMPT,
+            messages=[{'role': 'user', 'content': transcript}],
+        )
+        return ''.join(block.text for block in response.content if block.type == 'text')
+    return summarize
+
+
+class ConversationHistory:
+    """Token-budgeted message list with a summary of what fell off the front.
+
+    ``summarize`` is an optional callable (sync or async) taking a transcript
+    string and returning a summary string. Token counts are estimated from
+    character counts; ``record_usage`` calibrates the estimate against the
+    ``usage`` block of real responses.
+    """
+
+    def __init__(self, system: str, budget: int = 8000, target: int | None = None,
+                 keep_turns: int = 2, summarize=None):
+        self.system = system
+        self.budget = budget
+        self.target = target if target is not None else budget // 2
+        self.keep_turns = keep_turns
+        self.summarize = summarize
+        self.summary = ''
+        self.messages: list[dict] = []
+        self.chars_per_token = 4.0
+        self.compactions = 0
+
+    # ------------------------------------------------------------------
+    # Recording turns
+    # ------------------------------------------------------------------
+    def add_user(self, content) -> None:
+        self.messages.append({'role': 'user', 'content': content})
+
+    def add_assistant(self, content) -> None:
+        self.messages.append({'role': 'assistant', 'content': content})
+
+    def discard_turn(self) -> None:
+        """Drop the latest turn, e.g. after the request for it failed."""
+        starts = [i for i, m in enumerate(self.messages) if _is_turn_start(m)]
+        if starts:
+            del self.messages[starts[-1]:]
+
+    def record_usage(self, usage) -> None:
+        """Calibrate the token estimate from a response's ``usage``."""
+        tokens = (
+            (getattr(usage, 'input_tokens', 0) or 0)
+            + (getattr(usage, 'cache_read_input_tokens', 0) or 0)
+            + (getattr(usage, 'cache_creation_input_tokens', 0) or 0)
+        )
+        if tokens > 0:
+            chars = len(self.system) + len(self.summary) + sum(
+                _content_chars(m['content']) for m in self.messages
+            )
+            self.chars_per_token = max(chars / tokens, 1.0)
+
+    # ------------------------------------------------------------------
+    # Building requests
+    # ------------------------------------------------------------------
+    def tokens(self) -> int:
+        chars = len(self.summary) + sum(_content_chars(m['content']) for m in self.messages)
+        return int(chars / self.chars_per_token)
+
+    def system_blocks(self) -> list[dict]:
+        blocks = [{'type': 'text', 'text': self.system, 'cache_control': CACHE}]
+        if self.summary:
+            blocks.append({
+                'type': 'text',
+                'text': f"Summary of the earlier conversation:\n{self.summary}",
+            })
+        return blocks
+
+    def request_messages(self) -> list[dict]:
+        """Messages for the next request, with the stable prefix cache-marked.
+
+        The breakpoint sits on the last message before the newest turn, i.e.
+        everything the previous request already sent.
+        """
+        messages = [dict(m) for m in self.messages]
+        starts = [i for i, m in enumerate(messages) if _is_turn_start(m)]
+        if starts and starts[-1] > 0:
+            prefix_end = messages[starts[-1] - 1]
+            blocks = _as_blocks(prefix_end['content'])
+            if blocks and isinstance(blocks[-1], dict):
+                blocks[-1]['cache_control'] = CACHE
+                prefix_end['content'] = blocks
+        return messages
+
+    # ------------------------------------------------------------------
+    # Compaction
+    # ------------------------------------------------------------------
+    async def compact(self) -> bool:
+        """Fold old turns into the summary if over budget; return True if it did."""
+        if self.tokens() <= self.budget:
+            return False
+        starts = [i for i, m in enumerate(self.messages) if _is_turn_start(m)]
+        removable = starts[:max(len(starts) - self.keep_turns, 0)]
+        if not removable:
+            return False
+
+        # Cut at a turn boundary, as early as still gets under `target`.
+        cut = starts[len(removable)] if len(removable) < len(starts) else len(self.messages)
+        for start in starts[1:len(removable) + 1]:
+            kept = self.messages[start:]
+            if int(sum(_content_chars(m['content']) for m in kept) / self.chars_per_token) \
+                    <= self.target:
+                cut = start
+                break
+        dropped, self.messages = self.messages[:cut], self.messages[cut:]
+        self.compactions += 1
+
+        # The turns are dropped even if summarizing fails, so the budget holds.
+        if self.summarize is not None:
+            transcript = _transcript(dropped)
+            if self.summary:
+                transcript = f"Earlier summary: {self.summary}\n{transcript}"
+            summary = self.summarize(transcript)
+            if inspect.isawaitable(summary):
+                summary = await summary
+            self.summary = summary.strip()
+        return True
@@ -0,0 +1,204 @@
+"""
+In-process counters and timers for the hot paths.
+
+    metrics.inc('poll_changes_total', 3)
+    with metrics.timer('doc_seconds', op='save'):
+        ...
+    @metrics.timed('db_query_seconds', query='get_labels')
+    def get_labels(): ...
+
+Timers are histograms (Prometheus buckets plus count/sum/max). Everything is
+exported by render_prometheus() for the server's /metrics endpoint and by
+summary() for the agent's periodic log line.
+
+Set RELEASE_NOTE_METRICS=0 (or call enable(False)) to turn recording off;
+every entry point then returns after a single flag check.
+"""
+import functools
+import os
+import threading
+import time
+
+PREFIX = 'release_notes_'
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get('RELEASE_NOTE_METRICS', '1') != '0'
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}   # (name, labels) -> value
+_timers: dict[tuple, list] = {}      # (name, labels) -> [count, sum, max, *bucket counts]
+
+
+def enable(flag: bool = True) -> None:
+    global _enabled
+    _enabled = flag
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    if not _enabled:
+        return
+    _observe(_key(name, labels), seconds)
+
+
+def _observe(key, seconds):
+    with _lock:
+        stats = _timers.get(key)
+        if stats is None:
+            stats = _timers[key] = [0, 0.0, 0.0] + [0] * len(BUCKETS)
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats[3 + i] += 1
+                break
+
+
+class _Timer:
+    __slots__ = ('key', 'start')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timer(name: str, **labels):
+    """Context manager that records its block's duration."""
+    if not _enabled:
+        return _NOOP
+    return _Timer(_key(name, labels))
+
+
+def timed(name: str, **labels):
+    """Decorator form of timer(); the label key is built once, up front."""
+    key = _key(name, labels)
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _observe(key, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+def snapshot() -> dict:
+    """Copy of every series: {'counters': {key: value}, 'timers': {key: stats}}."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timers': {key: list(stats) for key, stats in _timers.items()},
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_prometheus() -> str:
+    """All series in the Prometheus text exposition format (version 0.0.4)."""
+    snap = snapshot()
+    lines = []
+    by_name: dict[str, list] = {}
+    for (name, labels), value in sorted(snap['counters'].items()):
+        by_name.setdefault(name, []).append((labels, value))
+    for name, series in by_name.items():
+        lines.append(f'# TYPE {PREFIX}{name} counter')
+        for labels, value in series:
+            lines.append(f'{PREFIX}{name}{_labels_text(labels)} {value:g}')
+
+    by_name = {}
+    for (name, labels), stats in sorted(snap['timers'].items()):
+        by_name.setdefault(name, []).append((labels, stats))
+    for name, series in by_name.items():
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        for labels, stats in series:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats[3:]):
+                cumulative += count
+                lines.append(f'{PREFIX}{name}_bucket'
+                             f'{_labels_text(labels, [("le", f"{bound:g}")])} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{_labels_text(labels, [("le", "+Inf")])} {stats[0]}')
+            lines.append(f'{PREFIX}{name}_sum{_labels_text(labels)} {stats[1]:.6f}')
+            lines.append(f'{PREFIX}{name}_count{_labels_text(labels)} {stats[0]}')
+    return '\n'.join(lines) + '\n'
+
+
+def summary(previous: dict | None = None) -> tuple[list[str], dict]:
+    """Lines for every series that moved since ``previous``, plus a new snapshot.
+
+    Pass the returned snapshot back in next time. Timers report count and
+    average over the interval, and the all-time max.
+    """
+    snap = snapshot()
+    previous = previous or {'counters': {}, 'timers': {}}
+    lines = []
+    for key, value in sorted(snap['counters'].items()):
+        delta = value - previous['counters'].get(key, 0)
+        if delta:
+            lines.append(f'{key[0]}{_labels_text(key[1])} +{delta:g}')
+    for key, stats in sorted(snap['timers'].items()):
+        before = previous['timers'].get(key, [0, 0.0])
+        count = stats[0] - before[0]
+        if count:
+            avg_ms = (stats[1] - before[1]) / count * 1000
+            lines.append(f'{key[0]}{_labels_text(key[1])} {count}× avg {avg_ms:.2f} ms, '
+                         f'max {stats[2] * 1000:.1f} ms')
+    return lines, snap
@@ -0,0 +1,198 @@
+"""
+Opt-in cProfile capture for slow operations, and a slow-query log.
+
+Off until enable() is called (the --profile flags on agent.py and server.py).
+Once on, every profiled operation — an HTTP request, a doc generation, a poll
+tick — runs under cProfile; those that take at least ``threshold_ms`` are
+dumped to ``directory`` as <kind>-<name>-<time>-<n>-<ms>ms.prof (load with
+pstats or snakeviz) plus a .txt with the top functions by cumulative time.
+db.py calls slower than ``slow_query_ms`` are appended to slow_queries.log
+in the same directory.
+
+At most one profile runs at a time in the whole process: from Python 3.12
+cProfile sits on sys.monitoring, which allows a single active profiler, and
+its hooks then see every thread, so a dump may include work done by other
+threads meanwhile. An operation that starts while another is being profiled
+(nested in it or on another thread) simply runs unprofiled.
+"""
+import functools
+import io
+import itertools
+import os
+import re
+import reprlib
+import sys
+import threading
+import time
+
+_config = None  # (directory, threshold seconds, slow-query seconds) once enabled
+_busy = threading.Lock()  # held while a profile is running, anywhere in the process
+_log_lock = threading.Lock()
+_dump_seq = itertools.count(1)  # keeps same-second dumps apart
+
+
+def enable(directory='profiles', threshold_ms=500, slow_query_ms=100):
+    global _config
+    os.makedirs(directory, exist_ok=True)
+    _config = (os.path.abspath(directory), threshold_ms / 1000, slow_query_ms / 1000)
+
+
+def disable():
+    global _config
+    _config = None
+
+
+def config():
+    """Arguments for enable() matching the current state, or None when off."""
+    if _config is None:
+        return None
+    directory, threshold, slow_query = _config
+    return directory, threshold * 1000, slow_query * 1000
+
+
+def add_arguments(parser):
+    """Add the --profile options shared by agent.py and server.py."""
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile requests / generations / poll ticks and dump the slow ones",
+    )
+    parser.add_argument("--profile-dir", default="profiles", metavar="DIR",
+                        help="Where profiles and slow_queries.log go (default: profiles)")
+    parser.add_argument("--profile-threshold", type=float, default=500, metavar="MS",
+                        help="Dump profiles of operations at least this slow (default: 500)")
+    parser.add_argument("--slow-query", type=float, default=100, metavar="MS",
+                        help="Log db calls at least this slow (default: 100)")
+
+
+def enable_from_args(args):
+    if args.profile:
+        enable(args.profile_dir, args.profile_threshold, args.slow_query)
+
+
+class Profile:
+    """One profiled operation, created by start(); set ``name`` before stop()
+    if it wasn't known up front."""
+
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+        import cProfile  # with pstats, only loaded once profiling is on
+        self.start = time.perf_counter()
+        self._profiler = cProfile.Profile()
+        self._profiler.enable()
+
+    def stop(self):
+        """Stop profiling; return the dump path if the operation was slow."""
+        self._profiler.disable()
+        _busy.release()
+        elapsed = time.perf_counter() - self.start
+        config = _config
+        if config is None or self.name is None or elapsed < config[1]:
+            return None
+        return _dump(self._profiler, self.kind, self.name, elapsed)
+
+
+def start(kind, name=None):
+    """Begin profiling; None when off, already profiling, or cProfile refuses."""
+    if _config is None or not _busy.acquire(blocking=False):
+        return None
+    try:
+        return Profile(kind, name)
+    except ValueError:  # 3.12+: another profiling tool is already active
+        _busy.release()
+        return None
+
+
+class profile:
+    """``with profiling.profile('generate', label):`` — no-op when off."""
+
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+        self._profile = None
+
+    def __enter__(self):
+        self._profile = start(self.kind, self.name)
+        return self._profile
+
+    def __exit__(self, *exc):
+        if self._profile is not None:
+            self._profile.stop()
+        return False
+
+
+def profiled(kind):
+    """Decorator: profile each call, named after its first argument if any."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _config is None:
+                return fn(*args, **kwargs)
+            with profile(kind, str(args[0]) if args else fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _dump(profiler, kind, name, elapsed):
+    """Write the .prof and .txt for one operation; None if they can't be written."""
+    try:
+        return _write_dump(profiler, kind, name, elapsed)
+    except Exception as exc:  # disk full, directory removed: never fail the operation
+        print(f"[PROFILE ERROR] could not write {kind} profile: {exc}",
+              file=sys.stderr, flush=True)
+        return None
+
+
+def _write_dump(profiler, kind, name, elapsed):
+    import pstats
+    directory = _config[0]
+    safe = re.sub(r'[^\w.\-]+', '_', name).strip('_')[:60] or 'op'
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    base = os.path.join(directory,
+                        f'{kind}-{safe}-{stamp}-{next(_dump_seq)}-{elapsed * 1000:.0f}ms')
+    profiler.dump_stats(base + '.prof')
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(30)
+    with open(base + '.txt', 'w') as f:
+        f.write(f'{kind} {name}: {elapsed * 1000:.1f} ms\n')
+        f.write(out.getvalue())
+    return base + '.prof'
+
+
+# ---------------------------------------------------------------------------
+# Slow-query log
+# ---------------------------------------------------------------------------
+def log_slow(fn):
+    """Decorator for db functions: log calls slower than the slow-query limit."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        config = _config
+        if config is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= config[2]:
+                _log_query(config[0], fn.__name__, args, kwargs, elapsed)
+    return wrapper
+
+
+def _log_query(directory, name, args, kwargs, elapsed):
+    # Runs in the db call's finally block: raising here would replace the
+    # call's own result or exception, so failures are only reported.
+    try:
+        params = ', '.join([reprlib.repr(a) for a in args]
+                           + [f'{k}={reprlib.repr(v)}' for k, v in kwargs.items()])
+        line = (f"{time.strftime('%Y-%m-%dT%H:%M:%S')} {elapsed * 1000:8.1f} ms  "
+                f"{name}({params})  [{threading.current_thread().name}]\n")
+        with _log_lock:
+            with open(os.path.join(directory, 'slow_queries.log'), 'a') as f:
+                f.write(line)
+    except Exception as exc:
+        print(f"[PROFILE ERROR] could not log slow query {name}: {exc}",
+              file=sys.stderr, flush=True)
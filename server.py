@@ -3,25 +3,148 @@ HTTP server for the Release Note Manager UI and JSON API.
 
 Endpoints:
     GET  /                   → serve ui/index.html
-    GET  /api/defects        → list all defects (JSON)
+    GET  /api/defects        → list defects (JSON); optional query parameters:
+                               after_id, limit (keyset pagination — a full
+                               page sets X-Next-After-Id), label, status,
+                               date_from, date_to, fields (comma-separated).
+                               With any parameter the page size defaults to
+                               (and is capped at) 1000; bare /api/defects
+                               still returns every defect. X-Change-Cursor is
+                               the change cursor the rows are current as of
+    GET  /api/defects/changes?since=<cursor>
+                             → {"defects": [...], "cursor": N, "more": bool} —
+                               rows created or modified after the cursor
+    GET  /api/events[?since=<cursor>]
+                             → Server-Sent Events stream; each "defects" event
+                               carries {"defects": [...], "cursor": N}
     POST /api/defects        → create a defect
+    POST /api/defects:batch  → create many defects in one transaction;
+                               body is a JSON array, returns {"ids": [...]}
     PATCH /api/defects/{id}  → update defect status
+    PATCH /api/defects:batch → body [{"id": N, "status": S}, ...] applied in
+                               one transaction, returns {"updated": N}
+    GET  /metrics            → counters and timers (db queries, doc builds,
+                               HTTP requests by route and status) in the
+                               Prometheus text format
     OPTIONS *                → CORS preflight
+
+Usage:
+    python server.py [--host HOST] [--port PORT] [--workers N]
+                     [--profile [--profile-dir DIR] [--profile-threshold MS] [--slow-query MS]]
+
+Connections are served by a bounded thread pool with HTTP/1.1 keep-alive.
+GET responses carry strong ETags (DB change cursor for the API, content hash
+for static files), answer If-None-Match with 304, and are gzip/deflate
+compressed when the client's Accept-Encoding allows it.
 """
+import argparse
+import gzip
+import hashlib
 import json
 import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 
 import db
+import db_pool
+import metrics
+import profiling
 
 UI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ui')
 
+DEFAULT_WORKERS = 16
+KEEPALIVE_TIMEOUT = 5  # seconds an idle keep-alive connection may hold a worker
+MAX_PAGE_SIZE = 1000
+EVENTS_POLL_INTERVAL = 1.0  # catch writes made by other processes (agent, scripts)
+EVENTS_HEARTBEAT = 15.0     # comment line that detects dead subscribers
+EVENTS_MAX_BUFFER = 1 << 20  # bytes queued for one subscriber before it is dropped
+EVENTS_FLUSH_INTERVAL = 0.05  # retry sends this often while any subscriber is behind
+MIN_COMPRESS_SIZE = 512     # bytes; smaller bodies aren't worth compressing
+
+# path -> (mtime_ns, size, body, etag, {encoding: compressed body})
+_static_cache = {}
+_static_cache_lock = threading.Lock()
+
+
+ROUTES = ('/', '/api/defects', '/api/defects/changes', '/api/defects:batch',
+          '/api/events', '/metrics')
+
+
+def _route(path):
+    """Collapse a request path to a low-cardinality route label."""
+    if path in ROUTES:
+        return path
+    parts = path.strip('/').split('/')
+    if len(parts) == 3 and parts[:2] == ['api', 'defects']:
+        return '/api/defects/{id}'
+    return 'other'
+
 
 class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive; every response sets Content-Length
+    # Headers and body go out as separate writes; without TCP_NODELAY the body
+    # waits on the client's delayed ACK (~40 ms per keep-alive request).
+    disable_nagle_algorithm = True
+    timeout = KEEPALIVE_TIMEOUT
 
     def log_message(self, format, *args):  # noqa: A002
-        pass  # suppress default access log
+        pass  # suppress default access log; per-route counts are in /metrics
+
+    # ------------------------------------------------------------------
+    # Instrumentation
+    # ------------------------------------------------------------------
+    def parse_request(self):
+        # Runs once the request line has arrived, so time a keep-alive
+        # connection spends idle before it isn't charged to the request.
+        self._start = time.perf_counter()
+        try:
+            self._profile = profiling.start('request')
+        except Exception as exc:  # profiling must never cost the request
+            print(f"[PROFILE ERROR] {exc}", file=sys.stderr, flush=True)
+            self._profile = None
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self._status = None
+        self._profile = None
+        # Reset by parse_request once a request line arrives; covers requests
+        # rejected before that (e.g. 414) without reusing the previous start.
+        self._start = time.perf_counter()
+        try:
+            super().handle_one_request()
+        except BaseException:
+            self.close_connection = True  # no response went out; don't wait for another request
+            self._record_request()
+            raise
+        self._record_request()
+
+    def _record_request(self):
+        prof, self._profile = self._profile, None
+        if self._status is None:  # connection closed or timed out between requests
+            if prof is not None:
+                prof.stop()
+            return
+        route = _route(urlparse(getattr(self, 'path', '')).path)
+        method = self.command or 'INVALID'  # unparseable request line
+        if prof is not None:
+            prof.name = f'{method} {route}'
+            prof.stop()
+        if metrics.enabled():
+            metrics.observe('http_request_seconds', time.perf_counter() - self._start,
+                            route=route, method=method)
+            metrics.inc('http_requests_total', route=route, method=method,
+                        status=str(self._status))
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
 
     # ------------------------------------------------------------------
     # CORS helpers
@@ -30,25 +153,121 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PATCH, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Expose-Headers', 'X-Next-After-Id, X-Change-Cursor, ETag')
 
     def do_OPTIONS(self):
         self.send_response(200)
         self._cors_headers()
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     # ------------------------------------------------------------------
     # GET
     # ------------------------------------------------------------------
     def do_GET(self):
-        path = urlparse(self.path).path
+        url = urlparse(self.path)
+        path = url.path
 
         if path == '/':
             self._serve_file(os.path.join(UI_DIR, 'index.html'), 'text/html; charset=utf-8')
         elif path == '/api/defects':
-            self._json_response(db.get_all_defects())
+            cursor = db.get_change_cursor()
+            etag = self._data_etag(cursor)
+            if not self._not_modified(etag):
+                self._list_defects(url.query, etag, cursor)
+        elif path == '/api/defects/changes':
+            etag = self._data_etag()
+            if not self._not_modified(etag):
+                self._defect_changes(parse_qs(url.query), etag)
+        elif path == '/api/events':
+            self._event_stream(parse_qs(url.query))
+        elif path == '/metrics':
+            body = metrics.render_prometheus().encode()
+            self._send_body(200, body, 'text/plain; version=0.0.4; charset=utf-8')
         else:
             self._not_found()
 
+    def _list_defects(self, query_string, etag=None, cursor=None):
+        # Read before the rows, so replaying /changes from it can only repeat
+        # a change, never miss one.
+        headers = {'X-Change-Cursor': str(db.get_change_cursor() if cursor is None else cursor)}
+        # Only a bare /api/defects lists everything: any query string at all,
+        # even ?limit= or ?fields=, gets a capped page.
+        if not query_string:
+            self._json_response(db.get_all_defects(), headers=headers, etag=etag)
+            return
+        query = parse_qs(query_string, keep_blank_values=True)
+
+        def param(name):
+            values = query.get(name)
+            return (values[-1] or None) if values else None  # blank = not given
+
+        try:
+            after_id = int(param('after_id') or 0)
+            # Any parameter opts into paging, so a filter alone can't pull the table
+            limit = min(int(param('limit') or MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError("limit must be positive")
+            status = param('status')
+            if status is not None and status not in ('OPEN', 'RESOLVED'):
+                raise ValueError("status must be OPEN or RESOLVED")
+            fields = param('fields')
+            defects = db.query_defects(
+                after_id=after_id,
+                limit=limit,
+                label=param('label'),
+                status=status,
+                date_from=param('date_from'),
+                date_to=param('date_to'),
+                fields=[f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+            )
+        except ValueError as exc:
+            self._bad_request(str(exc))
+            return
+
+        if len(defects) == limit:
+            headers['X-Next-After-Id'] = str(defects[-1]['id'])
+        self._json_response(defects, headers=headers, etag=etag)
+
+    def _defect_changes(self, query, etag=None):
+        try:
+            since = int(query.get('since', ['0'])[-1])
+            limit = min(int(query.get('limit', [str(MAX_PAGE_SIZE)])[-1]), MAX_PAGE_SIZE)
+            if since < 0 or limit < 1:
+                raise ValueError("since must be >= 0 and limit positive")
+        except ValueError as exc:
+            self._bad_request(str(exc))
+            return
+        try:
+            defects, cursor, more = db.get_defects_changed_since(since, limit)
+        except db.CursorExpired as exc:
+            # The client reloads from /api/defects and resumes from its cursor
+            self._json_response({'error': str(exc)}, status=410)
+            return
+        self._json_response({'defects': defects, 'cursor': cursor, 'more': more}, etag=etag)
+
+    def _event_stream(self, query):
+        # EventSource reconnects send Last-Event-ID, which wins over ?since=
+        since = self.headers.get('Last-Event-ID') or query.get('since', [None])[-1]
+        try:
+            cursor = int(since) if since is not None else db.get_change_cursor()
+        except ValueError:
+            self._bad_request("Invalid cursor")
+            return
+
+        self.close_connection = True  # body is delimited by the connection closing
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self._cors_headers()
+        self.end_headers()
+        self.wfile.write(b'retry: 3000\n\n')
+        self.wfile.flush()
+
+        # From here on the broker thread owns the socket; this worker is freed.
+        self.server.detach(self.request)
+        self.server.events.subscribe(self.request, cursor)
+
     # ------------------------------------------------------------------
     # POST
     # ------------------------------------------------------------------
@@ -66,7 +285,19 @@ class RequestHandler(BaseHTTPRequestHandler):
                 label=body.get('label', ''),
                 status=body.get('status', 'OPEN'),
             )
+            self.server.events.notify()
             self._json_response({'id': defect_id}, status=201)
+        elif path == '/api/defects:batch':
+            body = self._read_json_list()
+            if body is None:
+                return
+            try:
+                ids = db.create_defects(body)
+            except sqlite3.IntegrityError as exc:
+                self._bad_request(f"Batch rejected: {exc}")
+                return
+            self.server.events.notify()
+            self._json_response({'ids': ids}, status=201)
         else:
             self._not_found()
 
@@ -74,7 +305,12 @@ class RequestHandler(BaseHTTPRequestHandler):
     # PATCH
     # ------------------------------------------------------------------
     def do_PATCH(self):
-        parts = urlparse(self.path).path.strip('/').split('/')
+        path = urlparse(self.path).path
+        if path == '/api/defects:batch':
+            self._batch_update()
+            return
+
+        parts = path.strip('/').split('/')
         # Expected: ['api', 'defects', '<id>']
         if len(parts) == 3 and parts[0] == 'api' and parts[1] == 'defects':
             try:
@@ -89,14 +325,42 @@ class RequestHandler(BaseHTTPRequestHandler):
 
             if 'status' in body:
                 db.update_defect_status(defect_id, body['status'])
+                self.server.events.notify()
 
             self._json_response({'id': defect_id, 'status': body.get('status')})
         else:
             self._not_found()
 
+    def _batch_update(self):
+        body = self._read_json_list()
+        if body is None:
+            return
+        try:
+            updates = [(int(item['id']), item['status']) for item in body]
+        except (KeyError, TypeError, ValueError):
+            self._bad_request("Each update needs an integer 'id' and a 'status'")
+            return
+        try:
+            updated = db.update_defect_statuses(updates)
+        except sqlite3.IntegrityError as exc:
+            self._bad_request(f"Batch rejected: {exc}")
+            return
+        self.server.events.notify()
+        self._json_response({'updated': updated})
+
     # ------------------------------------------------------------------
     # Utility
     # ------------------------------------------------------------------
+    def _read_json_list(self):
+        """Read a JSON array of objects, or send 400 and return None."""
+        body = self._read_json()
+        if body is None:
+            return None
+        if not isinstance(body, list) or not all(isinstance(item, dict) for item in body):
+            self._bad_request("Expected a JSON array of objects")
+            return None
+        return body
+
     def _read_json(self):
         try:
             length = int(self.headers.get('Content-Length', 0))
@@ -106,50 +370,332 @@ class RequestHandler(BaseHTTPRequestHandler):
             self._bad_request(str(exc))
             return None
 
+    def _data_etag(self, cursor=None):
+        """ETag for API reads: the DB change cursor plus the exact query."""
+        if cursor is None:
+            cursor = db.get_change_cursor()
+        return f'"d{cursor}-{zlib.crc32(self.path.encode()):08x}"'
+
+    def _not_modified(self, etag):
+        """Send 304 and return True if the client already holds ``etag``.
+
+        Compressed variants carry ``;gzip`` / ``;deflate`` inside the quotes;
+        any variant of the current entity matches.
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        matched = None
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*' or tag.split(';')[0].rstrip('"') == etag.rstrip('"'):
+                matched = etag if tag == '*' else tag
+                break
+        if matched is None:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', matched)
+        self.send_header('Vary', 'Accept-Encoding')
+        self._cors_headers()
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return True
+
+    def _accepted_encoding(self):
+        accept = self.headers.get('Accept-Encoding', '')
+        offered = {}
+        for item in accept.split(','):
+            name, _, params = item.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            offered[name.strip().lower()] = q
+        for encoding in ('gzip', 'deflate'):
+            if offered.get(encoding, 0) > 0:
+                return encoding
+        return None
+
+    @staticmethod
+    def _compress(body, encoding):
+        if encoding == 'gzip':
+            return gzip.compress(body, compresslevel=6, mtime=0)
+        return zlib.compress(body, 6)
+
+    def _send_body(self, status, body, content_type, etag=None, headers=None,
+                   compressed=None):
+        """Send ``body``, compressed if negotiated; ``compressed`` caches variants."""
+        encoding = self._accepted_encoding() if len(body) >= MIN_COMPRESS_SIZE else None
+        if encoding:
+            if compressed is not None and encoding in compressed:
+                body = compressed[encoding]
+            else:
+                variant = self._compress(body, encoding)
+                if compressed is not None:
+                    compressed[encoding] = variant
+                body = variant
+            if etag:
+                etag = f'{etag[:-1]};{encoding}"'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if etag:
+            self.send_header('ETag', etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self._cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
     def _serve_file(self, path, content_type):
         try:
-            with open(path, 'rb') as fh:
-                data = fh.read()
-            self.send_response(200)
-            self.send_header('Content-Type', content_type)
-            self._cors_headers()
-            self.end_headers()
-            self.wfile.write(data)
+            st = os.stat(path)
         except FileNotFoundError:
             self._not_found()
+            return
+        with _static_cache_lock:
+            entry = _static_cache.get(path)
+            if entry is None or entry[:2] != (st.st_mtime_ns, st.st_size):
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+                etag = f'"s{hashlib.sha256(data).hexdigest()[:20]}"'
+                entry = _static_cache[path] = (st.st_mtime_ns, st.st_size, data, etag, {})
+        _, _, data, etag, compressed = entry
+        if self._not_modified(etag):
+            return
+        self._send_body(200, data, content_type, etag=etag, compressed=compressed)
 
-    def _json_response(self, data, status=200):
+    def _json_response(self, data, status=200, headers=None, etag=None):
         body = json.dumps(data, default=str).encode()
-        self.send_response(status)
-        self.send_header('Content-Type', 'application/json')
-        self._cors_headers()
-        self.end_headers()
-        self.wfile.write(body)
+        self._send_body(status, body, 'application/json', etag=etag, headers=headers)
 
     def _not_found(self):
+        # The request body (if any) was not read, so the connection can't be reused.
+        self.close_connection = True
         self.send_response(404)
         self._cors_headers()
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
     def _bad_request(self, msg="Bad request"):
+        self.close_connection = True
         body = json.dumps({'error': msg}).encode()
         self.send_response(400)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self._cors_headers()
         self.end_headers()
         self.wfile.write(body)
 
 
-def run(host='localhost', port=8080):
+class EventBroker:
+    """Push defect changes to Server-Sent Events subscribers.
+
+    One thread owns every subscriber socket. It wakes on notify() from the
+    write handlers (and every EVENTS_POLL_INTERVAL seconds for writes made
+    by other processes), reads the change feed once per distinct subscriber
+    cursor and sends each subscriber a single "defects" event per batch.
+
+    Sockets are non-blocking, so a slow subscriber never holds up the rest:
+    what it can't take yet waits in its own buffer, and once that exceeds
+    EVENTS_MAX_BUFFER the subscriber is dropped. EventSource reconnects with
+    Last-Event-ID and resumes from the last event it received.
+    """
+
+    def __init__(self, poll_interval=EVENTS_POLL_INTERVAL, heartbeat=EVENTS_HEARTBEAT):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self._clients = {}  # socket -> cursor of the last change queued for it
+        self._pending = {}  # socket -> bytes not yet accepted by it (broker thread only)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sse-broker")
+        self._thread.start()
+
+    def subscribe(self, sock, cursor):
+        sock.setblocking(False)
+        with self._lock:
+            self._clients[sock] = cursor
+        self._wake.set()
+
+    def notify(self):
+        self._wake.set()
+
+    def _events_since(self, cursor):
+        """Return (encoded events, new cursor) for changes after ``cursor``."""
+        chunks = []
+        more = True
+        while more:
+            defects, cursor_after, more = db.get_defects_changed_since(cursor)
+            if not defects:
+                break
+            cursor = cursor_after
+            payload = json.dumps({'defects': defects, 'cursor': cursor}, default=str)
+            chunks.append(f'event: defects\nid: {cursor}\ndata: {payload}\n\n'.encode())
+        return b''.join(chunks), cursor
+
+    def _run(self):
+        last_beat = time.monotonic()
+        while not self._closed:
+            self._wake.wait(EVENTS_FLUSH_INTERVAL if self._pending else self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                clients = dict(self._clients)
+            if not clients:
+                continue
+
+            beat = time.monotonic() - last_beat >= self.heartbeat
+            if beat:
+                last_beat = time.monotonic()
+            batches = {}
+            for sock, cursor in clients.items():
+                if cursor not in batches:
+                    try:
+                        batches[cursor] = self._events_since(cursor)
+                    except db.CursorExpired:
+                        # Tell the page to reload in full, then stream from now on
+                        latest = db.get_change_cursor()
+                        batches[cursor] = (
+                            f'event: reset\ndata: {{"cursor": {latest}}}\n\n'.encode(), latest
+                        )
+                    except Exception as exc:
+                        print(f"[SSE ERROR] {exc}", file=sys.stderr, flush=True)
+                        batches[cursor] = (b'', cursor)
+                data, new_cursor = batches[cursor]
+                if not data and beat and sock not in self._pending:
+                    data = b': ping\n\n'
+                if not data:
+                    continue
+                self._pending.setdefault(sock, bytearray()).extend(data)
+                with self._lock:
+                    if sock in self._clients:
+                        self._clients[sock] = new_cursor
+            for sock in list(self._pending):
+                self._flush(sock)
+
+    def _flush(self, sock):
+        """Send as much of ``sock``'s buffer as it takes without blocking."""
+        buf = self._pending[sock]
+        try:
+            while buf:
+                del buf[:sock.send(buf)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._drop(sock)
+            return
+        if not buf:
+            del self._pending[sock]
+        elif len(buf) > EVENTS_MAX_BUFFER:
+            print(f"[SSE] dropping a subscriber {len(buf)} bytes behind",
+                  file=sys.stderr, flush=True)
+            self._drop(sock)
+
+    def _drop(self, sock):
+        self._pending.pop(sock, None)
+        with self._lock:
+            self._clients.pop(sock, None)
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        for sock in list(self._clients):
+            self._drop(sock)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles each connection on a bounded thread pool.
+
+    A slow client only ties up one worker; server_close() waits for
+    in-flight requests to finish. Event-stream sockets are detached from
+    their worker and handed to an EventBroker.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS):
+        # Set up before binding: a failed bind calls server_close(), which
+        # needs these, and must surface the bind error rather than a missing one.
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self._detached = set()
+        self._detached_lock = threading.Lock()
+        self.events = EventBroker()
+        super().__init__(server_address, handler_class)
+
+    def detach(self, request):
+        """Keep ``request``'s socket open after its handler returns."""
+        with self._detached_lock:
+            self._detached.add(request)
+
+    def shutdown_request(self, request):
+        with self._detached_lock:
+            if request in self._detached:
+                self._detached.discard(request)
+                return
+        super().shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.events.close()
+        self._pool.shutdown(wait=True)
+
+
+def make_server(host='localhost', port=8080, workers=DEFAULT_WORKERS):
     db.init_db()
-    server = HTTPServer((host, port), RequestHandler)
-    print(f"Release Note Manager running at http://{host}:{port}")
+    return PooledHTTPServer((host, port), RequestHandler, workers=workers)
+
+
+def run(host='localhost', port=8080, workers=DEFAULT_WORKERS):
+    server = make_server(host, port, workers)
+
+    # SIGTERM → graceful stop; shutdown() must run off the serving thread.
+    def _terminate(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, _terminate)
+
+    print(f"Release Note Manager running at http://{host}:{port} ({workers} workers)")
     try:
         server.serve_forever()
     except KeyboardInterrupt:
-        print("\nServer stopped.")
-        server.server_close()
+        pass
+    print("\nServer stopped.")
+    server.server_close()
+    db.close_write_queue()
+    db_pool.close_all()
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Release Note Manager server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        metavar="N",
+        help=f"Request worker threads (default: {DEFAULT_WORKERS})",
+    )
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.enable_from_args(args)
+    run(args.host, args.port, args.workers)
@@ -0,0 +1,227 @@
+"""
+Section 5 — Agent tests (no API key needed).
+
+Run from the project root:
+    python tests/test_agent.py
+"""
+import sys
+import os
+import asyncio
+import contextlib
+import io
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent
+import db
+import db_pool
+import doc_generator
+import history
+
+# Use a temporary database and docs dir so each run starts from a clean slate
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+db.DB_PATH = _tmp.name
+_tmp.close()
+doc_generator.DOCS_DIR = tempfile.mkdtemp()
+
+
+def setup():
+    db.init_db()
+    db.create_defect('Login crashes on Safari', '2024-01-15', 'Fixed null pointer', 'v1.0', 'RESOLVED')
+    return db.create_defect('Tooltip not showing', '2024-01-16', '', 'v1.0', 'OPEN')
+
+
+def test_route_intent(open_id):
+    cases = {
+        'Generate release notes for v1.0': ('generate', 'v1.0'),
+        'generate V1.0!': ('generate', 'v1.0'),
+        'exit': ('shutdown', None),
+        'Shut down.': ('shutdown', None),
+        'list labels': ('list_labels', None),
+        'Which labels are there?': ('list_labels', None),
+        f'status of defect {open_id}': ('status', str(open_id)),
+        f"What's the status of #{open_id}?": ('status', str(open_id)),
+        f'defect {open_id} status': ('status', str(open_id)),
+        # Ambiguous or unknown → the model handles it
+        'Generate release notes for v9.9': None,
+        'generate release notes': None,
+        'why did defect 3 get reopened?': None,
+        'please exit after generating v1.0': None,
+    }
+    for text, expected in cases.items():
+        got = agent.route_intent(text)
+        assert got == expected, f'{text!r}: expected {expected}, got {got}'
+    print(f'route_intent:        PASS  ({len(cases)} inputs)')
+
+
+def test_run_intent(open_id):
+    assert agent.run_intent('list_labels', None) == 'Labels: v1.0'
+    reply = agent.run_intent('status', str(open_id))
+    assert reply.startswith(f'Defect {open_id} (v1.0) is OPEN'), reply
+    assert agent.run_intent('status', '9999') == 'Defect 9999 not found.'
+
+    start = time.perf_counter()
+    agent.run_intent(*agent.route_intent('generate release notes for v1.0'))
+    agent.wait_for_generations()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    assert os.path.exists(doc_generator._doc_path('v1.0')), 'generate should write the doc'
+    assert agent.active_label == 'v1.0'
+
+    agent.run_intent('shutdown', None)
+    assert agent.shutdown_event.is_set(), 'shutdown should set the event'
+    agent.shutdown_event.clear()
+    print(f'run_intent:          PASS  (generate in {elapsed_ms:.0f} ms, no API call)')
+
+
+def test_poll_resolved_ids(open_id):
+    resolved_id = open_id - 1
+    agent.resolved_ids = agent.ResolvedIds(db.iter_resolved_ids())
+    agent.change_cursor = db.get_change_cursor()
+    agent.doc_scheduler = None
+    assert resolved_id in agent.resolved_ids and open_id not in agent.resolved_ids
+
+    quiet = contextlib.redirect_stdout(io.StringIO())  # [POLL] lines
+    db.update_defect_status(open_id, 'RESOLVED')
+    with quiet:
+        assert agent.poll_once() == 1
+    assert open_id in agent.resolved_ids, 'A resolved defect should join the set'
+    db.update_defect_status(open_id, 'OPEN')
+    with quiet:
+        assert agent.poll_once() == 1
+    assert open_id not in agent.resolved_ids, 'A reverted defect should leave the set'
+    assert len(agent.resolved_ids) == 1
+
+    nbytes = agent.ResolvedIds(range(1, 1_000_001)).nbytes
+    assert nbytes <= 256 * 1024, f'1M ids should fit in a bitset, took {nbytes} bytes'
+    print(f'poll resolved_ids:   PASS  (1M ids in {nbytes // 1024} KB)')
+
+
+def test_poll_expired_cursor(open_id):
+    agent.change_cursor = db.get_change_cursor()
+    agent.active_label = 'v1.0'
+    saved, db.CHANGE_RETENTION = db.CHANGE_RETENTION, 2
+    try:
+        db.update_defect_status(open_id, 'RESOLVED')
+        for i in range(3):  # push that change out of the retained feed
+            db.create_defect(f'Filler {i}', '2024-01-17', '', 'v-filler', 'OPEN')
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert agent.poll_once() == 0
+        assert open_id in agent.resolved_ids, 'Pruned changes should be picked up by the reload'
+        assert agent.change_cursor == db.get_change_cursor()
+    finally:
+        db.CHANGE_RETENTION = saved
+        db.update_defect_status(open_id, 'OPEN')
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent.poll_once()
+    assert '[POLL] Change cursor' in out.getvalue(), 'An expired cursor should be reported'
+    assert "'v1.0' rebuilt" in out.getvalue(), 'The active label should be rebuilt'
+    print('poll expired cursor: PASS  (state reloaded, doc rebuilt)')
+
+
+class StubStream:
+    """Replays canned stream events, recording what had run when each was sent."""
+
+    def __init__(self, events, final, log):
+        self.events, self.final, self.log = events, final, log
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+            self.log.append((event.type, agent.active_label))
+
+    async def get_final_message(self):
+        return self.final
+
+
+class StubClient:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+        self.log = []
+        self.messages = self
+
+    def stream(self, **kwargs):
+        self.requests.append(kwargs)
+        events, final = self.replies.pop(0)
+        return StubStream(events, final, self.log)
+
+
+def _text(text):
+    return SimpleNamespace(type='text', text=text)
+
+
+def _reply(blocks, stop_reason):
+    events = []
+    for block in blocks:
+        if block.type == 'text':
+            events.append(SimpleNamespace(type='text', text=block.text))
+        events.append(SimpleNamespace(type='content_block_stop', content_block=block))
+    usage = SimpleNamespace(input_tokens=10, cache_read_input_tokens=0,
+                            cache_creation_input_tokens=0)
+    return events, SimpleNamespace(content=blocks, stop_reason=stop_reason, usage=usage)
+
+
+def test_tool_use():
+    os.remove(doc_generator._doc_path('v1.0'))
+    agent.active_label = None
+    tool = SimpleNamespace(type='tool_use', id='toolu_1', name='generate_release_notes',
+                           input={'label': 'v1.0'})
+    client = StubClient([
+        _reply([_text('On it.'), tool, _text('Building now.')], 'tool_use'),
+        _reply([_text('Done.')], 'end_turn'),
+    ])
+    conversation = history.ConversationHistory(agent.SYSTEM_PROMPT)
+    conversation.add_user('Could you put together notes for the 1.0 release?')
+
+    usages = asyncio.run(agent.respond(client, conversation))
+    agent.wait_for_generations()
+
+    # The tool ran when its block closed, before the rest of the reply streamed
+    first_after_tool = client.log.index(('content_block_stop', 'v1.0'))
+    assert client.log[first_after_tool + 1] == ('text', 'v1.0'), client.log
+    assert os.path.exists(doc_generator._doc_path('v1.0')), 'Tool should generate the doc'
+    assert client.requests[0]['tools'] is agent.TOOLS
+    assert len(usages) == 2, 'Tool results should be sent back for the model to finish'
+    result = client.requests[1]['messages'][-1]['content'][0]
+    assert result['type'] == 'tool_result' and result['tool_use_id'] == 'toolu_1', result
+    assert [m['role'] for m in conversation.messages] == ['user', 'assistant', 'user', 'assistant']
+
+    bad = agent.run_tool(SimpleNamespace(id='toolu_2', name='get_defect_status', input={}))
+    assert bad['is_error'], 'A malformed tool call should come back as an error result'
+    print('respond (tool use):  PASS  (tool ran mid-stream, result sent back)')
+
+
+def teardown():
+    path = doc_generator._doc_path('v1.0')
+    if os.path.exists(path):
+        os.remove(path)
+    os.rmdir(doc_generator.DOCS_DIR)
+    db.close_write_queue()
+    db_pool.close_all()
+    os.unlink(db.DB_PATH)
+
+
+def main():
+    print('=== Agent ===')
+    open_id = setup()
+    test_route_intent(open_id)
+    test_run_intent(open_id)
+    test_poll_resolved_ids(open_id)
+    test_poll_expired_cursor(open_id)
+    test_tool_use()
+    teardown()
+    print('\nAll agent tests passed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,15 @@ Run from the project root:
 """
 import sys
 import os
+import sqlite3
 import tempfile
+import threading
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import db
+import db_pool
 
 # Use a temporary database so each run starts from a clean slate
 _tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
@@ -51,6 +55,233 @@ def test_update_status(defect_id):
     print('update_defect_status:     PASS')
 
 
+def test_change_feed(defect_id):
+    cursor = db.get_change_cursor()
+    assert cursor > 0, 'Creates should be recorded in the change feed'
+
+    assert db.get_changes_since(cursor) == [], 'Expected no changes past the latest cursor'
+
+    db.update_defect_status(defect_id, 'OPEN')  # unchanged status — not recorded
+    db.update_defect_status(defect_id, 'RESOLVED')
+    changes = db.get_changes_since(cursor)
+    assert len(changes) == 1, f'Expected 1 change, got {len(changes)}'
+    assert changes[0]['defect_id'] == defect_id and changes[0]['status'] == 'RESOLVED'
+    assert changes[0]['label'] == LABEL
+    assert db.get_change_cursor() == changes[0]['seq']
+    print(f'get_changes_since:        PASS  (cursor {cursor} → {changes[0]["seq"]})')
+
+
+def test_change_watcher(defect_id):
+    watcher = db.ChangeWatcher(addr=('127.0.0.1', 0), max_wait=0.05)
+    db.NOTIFY_ADDR = watcher.address
+    try:
+        assert not watcher.wait(0.05), 'Idle watcher should time out'
+
+        threading.Timer(0.05, db.update_defect_status, (defect_id, 'OPEN')).start()
+        start = time.monotonic()
+        assert watcher.wait(5), 'Watcher should wake on a db write'
+        notified_ms = (time.monotonic() - start) * 1000
+
+        # A writer that bypasses db.py is still seen through data_version
+        conn = sqlite3.connect(db.DB_PATH)
+        conn.execute("UPDATE defects SET status = 'RESOLVED' WHERE id = ?", (defect_id,))
+        conn.commit()
+        conn.close()
+        assert watcher.wait(5), 'Watcher should notice out-of-band writes'
+    finally:
+        watcher.close()
+    print(f'ChangeWatcher:            PASS  (woke after {notified_ms:.0f} ms)')
+
+
+def test_connection_pool():
+    conn = db.get_conn()
+    assert db.get_conn() is conn, 'Same thread should reuse its pooled connection'
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(db.get_conn()))
+    t.start()
+    t.join()
+    assert other[0] is not conn, 'Each thread should get its own connection'
+
+    synchronous = conn.execute('PRAGMA synchronous').fetchone()[0]
+    assert synchronous == 1, f'Expected synchronous=NORMAL (1), got {synchronous}'
+    print('db_pool:                  PASS')
+
+
+def assert_indexed(name, index=None):
+    """Fail if hot query ``name`` scans a table or sorts in a temp b-tree."""
+    sql, params = db.HOT_QUERIES[name]
+    plan = db.query_plan(sql, params)
+    bad = [line for line in plan if line.startswith('SCAN') or 'TEMP B-TREE' in line]
+    assert not bad, f'{name}: unindexed plan {plan}'
+    if index:
+        assert any(index in line for line in plan), f'{name}: expected {index} in {plan}'
+
+
+def test_query_plans():
+    assert_indexed('resolved_defects', 'idx_defects_label_status')
+    assert_indexed('resolved_ids', 'COVERING INDEX idx_defects_status_id')
+    for name in db.HOT_QUERIES:
+        assert_indexed(name)
+    print(f'query plans:              PASS  ({len(db.HOT_QUERIES)} hot queries indexed)')
+
+
+def test_query_defects():
+    db.create_defect('Paged A', '2024-02-01', '', 'v-page', 'OPEN')
+    db.create_defect('Paged B', '2024-02-02', '', 'v-page', 'RESOLVED')
+    db.create_defect('Paged C', '2024-02-03', '', 'v-page', 'RESOLVED')
+
+    page1 = db.query_defects(label='v-page', limit=2)
+    page2 = db.query_defects(label='v-page', limit=2, after_id=page1[-1]['id'])
+    assert [d['title'] for d in page1 + page2] == ['Paged A', 'Paged B', 'Paged C']
+
+    resolved = db.query_defects(label='v-page', status='RESOLVED', date_from='2024-02-03')
+    assert [d['title'] for d in resolved] == ['Paged C'], f'Unexpected filter result {resolved}'
+
+    projected = db.query_defects(label='v-page', fields=['status'])
+    assert set(projected[0]) == {'id', 'status'}, f'Unexpected columns {set(projected[0])}'
+    try:
+        db.query_defects(fields=['password'])
+        assert False, 'Unknown fields should be rejected'
+    except ValueError:
+        pass
+    print('query_defects:            PASS  (keyset pages, filters, projection)')
+
+
+def test_defects_changed_since():
+    cursor = db.get_change_cursor()
+    a = db.create_defect('Delta A', '2024-02-04', '', 'v-delta', 'OPEN')
+    b = db.create_defect('Delta B', '2024-02-04', '', 'v-delta', 'OPEN')
+    db.update_defect_status(a, 'RESOLVED')
+
+    defects, new_cursor, more = db.get_defects_changed_since(cursor)
+    assert [d['id'] for d in defects] == [b, a], f'Expected each row once, by latest change: {defects}'
+    assert defects[1]['status'] == 'RESOLVED' and not more
+    assert new_cursor == db.get_change_cursor()
+
+    first, mid_cursor, more = db.get_defects_changed_since(cursor, limit=1)
+    assert [d['id'] for d in first] == [a] and more, 'limit should cap the changes consumed'
+    assert db.get_defects_changed_since(new_cursor) == ([], new_cursor, False)
+    print('get_defects_changed_since: PASS  (delta rows + cursor)')
+
+
+def test_bulk_writes():
+    cursor = db.get_change_cursor()
+    ids = db.create_defects([
+        {'title': f'Bulk {i}', 'date': '2024-02-05', 'label': 'v-bulk', 'status': 'OPEN'}
+        for i in range(50)
+    ])
+    assert len(ids) == 50 and ids == sorted(ids), 'create_defects should return ids in order'
+    assert db.update_defect_statuses([(i, 'RESOLVED') for i in ids[:20]]) == 20
+    assert [d['id'] for d in db.get_resolved_defects('v-bulk')] == ids[:20]
+    assert len(db.get_changes_since(cursor)) == 70, 'Every bulk row should hit the change feed'
+
+    try:
+        db.create_defects([
+            {'title': 'Good', 'date': '2024-02-05', 'label': 'v-bulk', 'status': 'OPEN'},
+            {'title': 'Bad', 'date': '2024-02-05', 'label': 'v-bulk', 'status': 'BOGUS'},
+        ])
+        assert False, 'Invalid status should abort the batch'
+    except sqlite3.IntegrityError:
+        pass
+    assert len(db.query_defects(label='v-bulk')) == 50, 'A failed batch should insert nothing'
+    print('create_defects/update_defect_statuses: PASS  (1 transaction per batch)')
+
+
+def test_write_queue():
+    ids = db.create_defects([
+        {'title': f'Queued {i}', 'date': '2024-02-06', 'label': 'v-queue', 'status': 'OPEN'}
+        for i in range(200)
+    ])
+    wq = db.WriteQueue(window=0.005)
+    try:
+        errors = []
+
+        def writer(chunk):
+            try:
+                futures = [wq.submit(db._update_statuses, [('RESOLVED', i)]) for i in chunk]
+                for future in futures:
+                    future.result()
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer, args=(ids[n::8],)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors, f'Concurrent writes failed: {errors[:1]}'
+        assert len(db.get_resolved_defects('v-queue')) == 200, 'Every queued write should commit'
+        assert wq.commits < wq.writes, f'Expected grouped commits, got {wq.commits} for {wq.writes}'
+
+        # A failing write is rolled back alone; the rest of its group commits.
+        bad = wq.submit(db._update_statuses, [('BOGUS', ids[0])])
+        good = wq.submit(db._update_statuses, [('OPEN', ids[1])])
+        assert good.result() == 1
+        try:
+            bad.result()
+            assert False, 'Invalid status should fail its own future'
+        except sqlite3.IntegrityError:
+            pass
+        statuses = {d['id']: d['status'] for d in db.get_defects_by_ids(ids[:2])}
+        assert statuses == {ids[0]: 'RESOLVED', ids[1]: 'OPEN'}, statuses
+    finally:
+        wq.close()
+    print(f'WriteQueue:               PASS  ({wq.writes} writes in {wq.commits} commits)')
+
+
+def test_durability():
+    try:
+        db._durability('FUL')
+        assert False, 'A misspelt durability should be rejected, not fall back to NORMAL'
+    except ValueError:
+        pass
+
+    queued, level = db.WRITE_QUEUE_ENABLED, db.WRITE_DURABILITY
+    db.WRITE_QUEUE_ENABLED, db.WRITE_DURABILITY = False, db._durability('full')
+    try:
+        db.create_defect('Durable', '2024-02-07', '', 'v-durable', 'OPEN')
+        synchronous = db.get_conn().execute('PRAGMA synchronous').fetchone()[0]
+        assert synchronous == 2, f'Direct writes should use FULL (2), got {synchronous}'
+    finally:
+        db.WRITE_QUEUE_ENABLED, db.WRITE_DURABILITY = queued, level
+        db.get_conn().execute(f'PRAGMA synchronous={level}')
+    print('durability:               PASS  (validated, applied without the queue)')
+
+
+def test_change_retention():
+    saved = db.CHANGE_RETENTION, db.WRITE_QUEUE_ENABLED
+    db.CHANGE_RETENTION = 10
+    try:
+        cursor = db.get_change_cursor()
+        db.create_defects([
+            {'title': f'Retained {i}', 'date': '2024-02-07', 'label': 'v-retain', 'status': 'OPEN'}
+            for i in range(30)
+        ])
+        count = db.get_conn().execute("SELECT COUNT(*) FROM defect_changes").fetchone()[0]
+        assert count == 10, f'The feed should keep the newest 10 changes, has {count}'
+
+        db.WRITE_QUEUE_ENABLED = False  # the direct write path prunes too
+        db.create_defect('Retained direct', '2024-02-07', '', 'v-retain', 'OPEN')
+        latest = db.get_change_cursor()
+        oldest = db.get_conn().execute("SELECT MIN(seq) FROM defect_changes").fetchone()[0]
+        assert oldest == latest - 9, 'Each write should prune past the retention'
+
+        for stale in (0, cursor, oldest - 2):
+            for read in (db.get_changes_since, db.get_defects_changed_since):
+                try:
+                    read(stale)
+                    assert False, f'{read.__name__}({stale}) should report a pruned cursor'
+                except db.CursorExpired as exc:
+                    assert exc.oldest == oldest
+        assert len(db.get_changes_since(oldest - 1)) == 10, 'The oldest kept cursor still works'
+        assert len(db.get_defects_changed_since(oldest - 1)[0]) == 10
+        assert db.get_changes_since(latest) == []
+    finally:
+        db.CHANGE_RETENTION, db.WRITE_QUEUE_ENABLED = saved
+    print(f'change feed retention:    PASS  (kept {count} changes, older cursors expire)')
+
+
 def test_release_info_missing():
     info = db.get_release_info('nonexistent-label')
     assert info is None, 'Expected None for unknown label'
@@ -62,8 +293,20 @@ def main():
     test_init()
     id1, id2, id3 = test_create_and_fetch()
     test_update_status(id1)
+    test_change_feed(id1)
+    test_change_watcher(id1)
+    test_connection_pool()
+    test_query_plans()
+    test_query_defects()
+    test_defects_changed_since()
+    test_bulk_writes()
+    test_write_queue()
+    test_durability()
+    test_change_retention()
     test_release_info_missing()
     print('\nAll DB tests passed.')
+    db.close_write_queue()
+    db_pool.close_all()
     os.unlink(db.DB_PATH)
 
 
@@ -10,17 +10,22 @@ Run from the project root:
 import sys
 import os
 import tempfile
+import zipfile
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import db
+import db_pool
 import doc_generator
 from docx import Document
 
 # Use a temporary database so each run starts from a clean slate
-_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
-db.DB_PATH = _tmp.name
-_tmp.close()
+# (create_docs' spawned workers re-import this module as __mp_main__; they
+# are handed the parent's DB_PATH instead)
+if __name__ != '__mp_main__':
+    _tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    db.DB_PATH = _tmp.name
+    _tmp.close()
 
 LABEL = 'v1.0'
 
@@ -59,6 +64,151 @@ def test_remove_row(resolved):
     print(f'remove_row:          PASS  (row {remove_id} gone, {len(rows)-1} data rows remain)')
 
 
+def test_apply_changes(resolved):
+    reinsert = resolved[0]
+    new_id = db.create_defect('Late fix', '2024-01-18', 'Added retry', LABEL, 'RESOLVED')
+    added = db.get_defects_by_ids([reinsert['id'], new_id])
+    path = doc_generator.apply_changes(LABEL, added=added)
+
+    doc = Document(path)
+    ids_in_doc = [int(row.cells[0].text) for row in doc.tables[0].rows[1:]]
+    assert ids_in_doc == sorted(ids_in_doc), f'Rows should stay in id order: {ids_in_doc}'
+    assert reinsert['id'] in ids_in_doc and new_id in ids_in_doc, 'Inserted rows missing'
+
+    doc_generator.apply_changes(LABEL, removed=[new_id])
+    ids_in_doc = [row.cells[0].text for row in Document(path).tables[0].rows[1:]]
+    assert str(new_id) not in ids_in_doc, f'Defect {new_id} should have been removed'
+    print(f'apply_changes:       PASS  ({len(ids_in_doc)} data rows after insert/remove)')
+
+
+def test_write_scheduler(resolved):
+    writes = []
+    scheduler = doc_generator.WriteScheduler(
+        window=0.1, on_write=lambda label, path, removed, added, ms: writes.append(ms),
+    )
+    ids = [d['id'] for d in resolved]
+    for defect_id in ids:
+        scheduler.submit(LABEL, removed=[defect_id])
+    scheduler.submit(LABEL, added=db.get_defects_by_ids(ids))  # latest op per defect wins
+    scheduler.close()
+
+    stats = scheduler.metrics()
+    assert len(writes) == 1 and stats['writes'] == 1, f'Expected one coalesced write, got {stats}'
+    assert stats['changes'] == len(ids), f'Expected {len(ids)} merged changes, got {stats}'
+    doc = Document(doc_generator._doc_path(LABEL))
+    ids_in_doc = [int(row.cells[0].text) for row in doc.tables[0].rows[1:]]
+    assert all(i in ids_in_doc for i in ids), 'Re-added rows should be present'
+    print(f'WriteScheduler:      PASS  ({len(ids) + 1} submits → 1 write in {writes[0]:.0f} ms)')
+
+
+def test_fast_backend():
+    db.create_defect('Tabs\tand\nbreaks', '2024-01-19', '  <escaped> & spaced ', LABEL, 'RESOLVED')
+    path = doc_generator.create_doc(LABEL, backend='docx')
+    with zipfile.ZipFile(path) as z:
+        expected = z.read('word/document.xml')
+    path = doc_generator.create_doc(LABEL, backend='fast', force=True)
+    with zipfile.ZipFile(path) as z:
+        streamed = z.read('word/document.xml')
+    assert streamed == expected, 'Streamed document.xml should match the python-docx output'
+
+    rows = list(Document(path).tables[0].rows)
+    print(f'create_doc (fast):   PASS  ({len(rows)-1} data rows, identical XML)')
+
+
+def test_fast_backend_failure():
+    path = doc_generator._doc_path(LABEL)
+    before = os.stat(path).st_mtime_ns
+    real_iter = db.iter_resolved_defects
+
+    def failing_iter(label, batch_size=1000):
+        yield from list(real_iter(label))[:1]
+        raise OSError('disk full')
+
+    db.iter_resolved_defects = failing_iter
+    try:
+        doc_generator.create_doc(LABEL, backend='fast', force=True)
+        assert False, 'A failed stream should raise'
+    except OSError:
+        pass
+    finally:
+        db.iter_resolved_defects = real_iter
+    assert not os.path.exists(path + '.tmp'), 'The partial .tmp file should be removed'
+    assert os.stat(path).st_mtime_ns == before, 'The previous doc should be left as it was'
+    print('create_doc (fast):   PASS  (failed stream leaves no .tmp behind)')
+
+
+def test_template():
+    template = Document()
+    template.add_paragraph('ACME Corp — internal')
+    tmpl = tempfile.NamedTemporaryFile(suffix='.docx', delete=False)
+    tmpl.close()
+    template.save(tmpl.name)
+
+    path = doc_generator.create_doc(LABEL, template=tmpl.name)
+    os.unlink(tmpl.name)  # cached after first use — later builds never reopen it
+    path = doc_generator.create_doc(LABEL, template=tmpl.name, force=True)
+
+    doc = Document(path)
+    assert doc.paragraphs[0].text == 'ACME Corp — internal', 'Template content should lead the doc'
+    assert doc.paragraphs[1].text == f'Release Notes — {LABEL}', 'Heading should follow the template'
+    rows = list(doc.tables[-1].rows)
+    assert rows[0].cells[0].text == 'ID', 'Header row missing'
+    print(f'create_doc (tmpl):   PASS  ({len(rows)-1} data rows on a cached template)')
+
+
+def test_fingerprint_skip():
+    path = doc_generator.create_doc(LABEL, force=True)
+    mtime = os.stat(path).st_mtime_ns
+
+    assert doc_generator.create_doc(LABEL) == path
+    assert os.stat(path).st_mtime_ns == mtime, 'Unchanged inputs should not rewrite the doc'
+
+    doc_generator.create_doc(LABEL, force=True)
+    assert os.stat(path).st_mtime_ns != mtime, 'force=True should always rewrite'
+    mtime = os.stat(path).st_mtime_ns
+
+    db.create_defect('Fingerprint change', '2024-01-20', '', LABEL, 'RESOLVED')
+    doc_generator.create_doc(LABEL)
+    assert os.stat(path).st_mtime_ns != mtime, 'Changed inputs should rewrite the doc'
+
+    # A write landing between the skip check and the stream: the stored
+    # fingerprint must describe the rows that went into the file.
+    db.create_defect('Before the check', '2024-01-21', '', LABEL, 'RESOLVED')
+    real_stream = doc_generator._stream_doc
+
+    def stream_after_write(*args, **kwargs):
+        db.create_defect('Between the passes', '2024-01-22', '', LABEL, 'RESOLVED')
+        return real_stream(*args, **kwargs)
+
+    doc_generator._stream_doc = stream_after_write
+    try:
+        path = doc_generator.create_doc(LABEL, backend='fast')
+    finally:
+        doc_generator._stream_doc = real_stream
+    resolved = db.get_resolved_defects(LABEL)
+    expected = doc_generator._fingerprint(resolved, db.get_release_info(LABEL), None)
+    assert db.get_doc_fingerprint(LABEL) == expected, 'Fingerprint should match the streamed rows'
+    ids_in_doc = [row.cells[0].text for row in list(Document(path).tables[0].rows)[1:]]
+    assert ids_in_doc == [str(d['id']) for d in resolved], 'Doc should hold the streamed rows'
+    print('create_doc (skip):   PASS  (unchanged inputs not rewritten, fingerprint = file)')
+
+
+def test_create_docs():
+    labels = [LABEL, 'v-batch-1', 'v-batch-2']
+    for label in labels[1:]:
+        db.create_defect(f'Batch defect for {label}', '2024-02-01', '', label, 'RESOLVED')
+
+    results = doc_generator.create_docs(labels, workers=2, force=True)
+    assert set(results) == set(labels), f'Missing labels in {results}'
+    for label, path in results.items():
+        assert not isinstance(path, Exception), f'{label} failed: {path}'
+        assert os.path.exists(path), f'Doc not found at {path}'
+        assert not doc_generator.label_lock(label).locked(), f'{label} lock not released'
+    for label in labels[1:]:
+        os.remove(results[label])
+    print(f'create_docs:         PASS  ({len(results)} labels on a process pool)')
+
+
 def test_remove_row_noop():
     doc_generator.remove_row('does-not-exist', 999)
     print('remove_row (no-op):  PASS')
@@ -68,6 +218,8 @@ def teardown():
     path = doc_generator._doc_path(LABEL)
     if os.path.exists(path):
         os.remove(path)
+    db.close_write_queue()
+    db_pool.close_all()
     os.unlink(db.DB_PATH)
 
 
@@ -76,6 +228,13 @@ def main():
     resolved = ensure_seed_data()
     _, rows = test_create_doc(resolved)
     test_remove_row(resolved)
+    test_apply_changes(resolved)
+    test_write_scheduler(resolved)
+    test_fast_backend()
+    test_fast_backend_failure()
+    test_template()
+    test_fingerprint_skip()
+    test_create_docs()
     test_remove_row_noop()
     teardown()
     print('\nAll doc generator tests passed.')
@@ -0,0 +1,115 @@
+"""
+Section 4 — Conversation history tests (no API key needed).
+
+Uses a stubbed client in place of anthropic.AsyncAnthropic.
+
+Run from the project root:
+    python tests/test_history.py
+"""
+import sys
+import os
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history
+
+SYSTEM = 'You are a Release Note Assistant.'
+
+
+class StubMessages:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        text = f'summary #{len(self.calls)}'
+        return SimpleNamespace(content=[SimpleNamespace(type='text', text=text)])
+
+
+class StubClient:
+    def __init__(self):
+        self.messages = StubMessages()
+
+
+def run_session(conv, turns):
+    sizes = []
+    for n in range(turns):
+        conv.add_user(f'Turn {n}: generate release notes for v{n}.0 please ' + 'x' * 200)
+        sizes.append(conv.tokens())
+        conv.add_assistant(f'Generated v{n}.0. ' + 'y' * 400)
+        asyncio.run(conv.compact())
+    return sizes
+
+
+def test_bounded():
+    client = StubClient()
+    conv = history.ConversationHistory(
+        SYSTEM, budget=2000, summarize=history.client_summarizer(client, 'stub-model'),
+    )
+    sizes = run_session(conv, 200)
+    assert max(sizes) <= 2000 + 200, f'History grew past its budget: {max(sizes)} tokens'
+    assert max(sizes[100:]) <= max(sizes[:50]), 'Request size should stay flat over a long session'
+    assert conv.messages[0]['role'] == 'user', 'History must still start with a user turn'
+    assert conv.compactions and len(client.messages.calls) == conv.compactions
+    assert conv.summary == f'summary #{conv.compactions}'
+    # Each summary is built on the previous one, not on the whole session
+    assert 'Earlier summary: summary #' in client.messages.calls[-1]['messages'][0]['content']
+    print(f'compact:             PASS  (200 turns ≤ {max(sizes)} tokens, '
+          f'{conv.compactions} summaries)')
+
+
+def test_truncate_without_summarizer():
+    conv = history.ConversationHistory(SYSTEM, budget=1000, keep_turns=1)
+    run_session(conv, 50)
+    assert conv.tokens() <= 1000 and conv.summary == ''
+    print('compact (truncate):  PASS')
+
+
+def test_cache_markers():
+    conv = history.ConversationHistory(SYSTEM)
+    conv.add_user('first question')
+    conv.add_assistant('first answer')
+    conv.add_user('second question')
+
+    system = conv.system_blocks()
+    assert system[0]['cache_control'] == {'type': 'ephemeral'}, 'System prompt should be cached'
+
+    messages = conv.request_messages()
+    prefix_end = messages[1]['content']
+    assert prefix_end[-1]['cache_control'] == {'type': 'ephemeral'}, 'Prefix should be cached'
+    assert messages[2]['content'] == 'second question', 'Newest turn is sent as-is'
+    assert conv.messages[1]['content'] == 'first answer', 'Stored history is not mutated'
+
+    conv.summary = 'earlier stuff'
+    assert len(conv.system_blocks()) == 2 and 'cache_control' not in conv.system_blocks()[1]
+    print('cache_control:       PASS  (system prompt + history prefix)')
+
+
+def test_discard_and_usage():
+    conv = history.ConversationHistory(SYSTEM)
+    conv.add_user('kept')
+    conv.add_assistant('reply')
+    conv.add_user('failed request')
+    conv.discard_turn()
+    assert [m['content'] for m in conv.messages] == ['kept', 'reply']
+
+    chars = len(SYSTEM) + len('kept') + len('reply')
+    conv.record_usage(SimpleNamespace(input_tokens=2, cache_read_input_tokens=8,
+                                      cache_creation_input_tokens=0))
+    assert abs(conv.chars_per_token - chars / 10) < 1e-9, 'Usage should calibrate the estimate'
+    print('discard/usage:       PASS')
+
+
+def main():
+    print('=== Conversation History ===')
+    test_bounded()
+    test_truncate_without_summarizer()
+    test_cache_markers()
+    test_discard_and_usage()
+    print('\nAll history tests passed.')
+
+
+if __name__ == '__main__':
+    main()
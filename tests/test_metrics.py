@@ -0,0 +1,113 @@
+"""
+Section 9 — Metrics tests.
+
+Run from the project root:
+    python tests/test_metrics.py
+"""
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import db
+import db_pool
+
+# Use a temporary database so each run starts from a clean slate
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+db.DB_PATH = _tmp.name
+_tmp.close()
+
+
+def test_counters_and_timers():
+    metrics.reset()
+    metrics.inc('widgets_total', 2, kind='a')
+    metrics.inc('widgets_total', kind='a')
+    with metrics.timer('step_seconds', op='x'):
+        time.sleep(0.002)
+    metrics.observe('step_seconds', 20, op='x')  # beyond the last bucket
+
+    snap = metrics.snapshot()
+    assert snap['counters'][('widgets_total', (('kind', 'a'),))] == 3
+    count, total, longest = snap['timers'][('step_seconds', (('op', 'x'),))][:3]
+    assert count == 2 and total > 20 and longest == 20
+    print('counters/timers:     PASS')
+
+
+def test_prometheus_format():
+    text = metrics.render_prometheus()
+    lines = text.splitlines()
+    assert '# TYPE release_notes_widgets_total counter' in lines
+    assert 'release_notes_widgets_total{kind="a"} 3' in lines
+    assert '# TYPE release_notes_step_seconds histogram' in lines
+    assert 'release_notes_step_seconds_bucket{op="x",le="+Inf"} 2' in lines
+    assert 'release_notes_step_seconds_bucket{op="x",le="10"} 1' in lines
+    assert 'release_notes_step_seconds_count{op="x"} 2' in lines
+    print('render_prometheus:   PASS')
+
+
+def test_instrumented_db():
+    metrics.reset()
+    db.init_db()
+    db.create_defect('Metered', '2024-04-01', '', 'v-metrics', 'RESOLVED')
+    db.get_resolved_defects('v-metrics')
+    lines, snap = metrics.summary()
+    assert any(line.startswith('db_query_seconds{query="get_resolved_defects"} 1×')
+               for line in lines), lines
+    db.get_labels()
+    lines, _ = metrics.summary(snap)
+    assert len(lines) == 1 and 'get_labels' in lines[0], 'Only what moved is reported'
+    print('summary (db):        PASS')
+
+
+def test_disabled_overhead():
+    metrics.reset()
+    metrics.enable(False)
+    try:
+        @metrics.timed('noop_seconds')
+        def noop():
+            return None
+
+        def bare():
+            return None
+
+        n = 100000
+        start = time.perf_counter()
+        for _ in range(n):
+            bare()
+        base = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(n):
+            noop()
+            metrics.inc('noop_total')
+            with metrics.timer('noop_seconds'):
+                pass
+        wrapped = time.perf_counter() - start
+        assert metrics.snapshot() == {'counters': {}, 'timers': {}}, 'Nothing recorded when off'
+    finally:
+        metrics.enable(True)
+    overhead_us = (wrapped - base) / n * 1e6
+    assert overhead_us < 5, f'Disabled metrics cost {overhead_us:.2f} µs per call'
+    print(f'disabled:            PASS  ({overhead_us * 1000:.0f} ns for timed + inc + timer)')
+
+
+def teardown():
+    db.close_write_queue()
+    db_pool.close_all()
+    os.unlink(db.DB_PATH)
+
+
+def main():
+    print('=== Metrics ===')
+    test_counters_and_timers()
+    test_prometheus_format()
+    test_instrumented_db()
+    test_disabled_overhead()
+    teardown()
+    print('\nAll metrics tests passed.')
+
+
+if __name__ == '__main__':
+    main()
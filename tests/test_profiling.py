@@ -0,0 +1,152 @@
+"""
+Section 10 — Profiling tests.
+
+Run from the project root:
+    python tests/test_profiling.py
+"""
+import sys
+import os
+import contextlib
+import io
+import pstats
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import db_pool
+import doc_generator
+import profiling
+
+# Use a temporary database, docs dir and profile dir
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+db.DB_PATH = _tmp.name
+_tmp.close()
+doc_generator.DOCS_DIR = tempfile.mkdtemp()
+PROFILE_DIR = tempfile.mkdtemp()
+LABEL = 'v-prof'
+
+
+def dumps(suffix):
+    return sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(suffix))
+
+
+def test_disabled():
+    db.init_db()
+    db.create_defect('Profiled', '2024-05-01', '', LABEL, 'RESOLVED')
+    doc_generator.create_doc(LABEL, force=True)
+    assert profiling.start('request') is None, 'start() is a no-op when off'
+    assert os.listdir(PROFILE_DIR) == [], 'Nothing is written while profiling is off'
+    print('disabled:            PASS')
+
+
+def test_slow_generation_dumped():
+    profiling.enable(PROFILE_DIR, threshold_ms=0, slow_query_ms=0)
+    with profiling.profile('request', 'GET /outer'):
+        doc_generator.create_doc(LABEL, force=True)  # nested: covered by the outer profile
+    [prof] = dumps('.prof')
+    assert prof.startswith('request-GET_outer-'), prof
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, prof))
+    assert any(func[2] == 'create_doc' for func in stats.stats), 'Profile should cover create_doc'
+    assert len(dumps('.txt')) == 1, 'A readable summary goes next to the .prof'
+
+    doc_generator.create_doc(LABEL, force=True)
+    assert any(f.startswith(f'generate-{LABEL}-') for f in dumps('.prof'))
+    print(f'profile dumps:       PASS  ({len(dumps(".prof"))} .prof files)')
+
+
+def test_threshold():
+    before = dumps('.prof')
+    profiling.enable(PROFILE_DIR, threshold_ms=60000, slow_query_ms=60000)
+    doc_generator.create_doc(LABEL, force=True)
+    assert dumps('.prof') == before, 'Fast operations are not dumped'
+    print('threshold:           PASS')
+
+
+def test_slow_query_log():
+    with open(os.path.join(PROFILE_DIR, 'slow_queries.log')) as f:
+        lines = f.read().splitlines()
+    assert any(f"get_resolved_defects('{LABEL}')" in line for line in lines), lines[:3]
+    print(f'slow_queries.log:    PASS  ({len(lines)} entries at 0 ms)')
+
+
+def test_concurrent_starts():
+    profiling.enable(PROFILE_DIR, threshold_ms=60000, slow_query_ms=60000)
+    barrier = threading.Barrier(2)
+    results, errors = [], []
+
+    def worker():
+        barrier.wait()
+        try:
+            results.append(profiling.start('request', 'GET /concurrent'))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, f'start() must not raise: {errors}'
+    running = [p for p in results if p is not None]
+    assert len(running) == 1, 'Only one profile may run at a time in the process'
+    running[0].stop()
+
+    # A refused enable() must not leave profiling stuck off
+    real = profiling.Profile
+
+    class Refused:
+        def __init__(self, kind, name=None):
+            raise ValueError('Another profiling tool is already active')
+
+    profiling.Profile = Refused
+    try:
+        assert profiling.start('request') is None, 'A refused profile is skipped'
+    finally:
+        profiling.Profile = real
+    prof = profiling.start('request')
+    assert prof is not None, 'Profiling resumes once the previous one has stopped'
+    prof.stop()
+    print('concurrent starts:   PASS  (one profile at a time, no errors)')
+
+
+def test_write_errors_are_contained():
+    profiling.enable(PROFILE_DIR, threshold_ms=0, slow_query_ms=0)
+    shutil.rmtree(PROFILE_DIR)  # every dump and log write now fails
+    err = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(err):
+            path = doc_generator.create_doc(LABEL, force=True)
+    finally:
+        os.makedirs(PROFILE_DIR)
+    assert os.path.exists(path), 'The doc is still written when its profile cannot be'
+    assert '[PROFILE ERROR]' in err.getvalue(), 'Write failures should be reported'
+    print('write errors:        PASS  (generation unaffected, error logged)')
+
+
+def teardown():
+    profiling.disable()
+    doc_generator.forget(LABEL)
+    shutil.rmtree(doc_generator.DOCS_DIR)
+    shutil.rmtree(PROFILE_DIR)
+    db.close_write_queue()
+    db_pool.close_all()
+    os.unlink(db.DB_PATH)
+
+
+def main():
+    print('=== Profiling ===')
+    test_disabled()
+    test_slow_generation_dumped()
+    test_threshold()
+    test_slow_query_log()
+    test_concurrent_starts()
+    test_write_errors_are_contained()
+    teardown()
+    print('\nAll profiling tests passed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,13 +9,25 @@ Run from the project root:
 """
 import sys
 import os
+import gzip
 import json
+import socket
+import tempfile
+import threading
+import time
 import argparse
+import http.client
 import urllib.request
 import urllib.error
+from urllib.parse import urlparse
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import db
+import db_pool
+import server
+from server import MAX_PAGE_SIZE
+
 BASE_URL = 'http://localhost:8080'
 
 
@@ -66,6 +78,28 @@ def test_patch_status(defect_id):
     print(f'PATCH /api/defects/{defect_id}:       PASS  (status=RESOLVED)')
 
 
+def test_batch_endpoints():
+    status, body = request_json('POST', '/api/defects:batch', [
+        {'title': f'Batch defect {i}', 'date': '2024-03-06', 'label': 'v-batch', 'status': 'OPEN'}
+        for i in range(25)
+    ])
+    assert status == 201, f'Expected 201, got {status}'
+    ids = body['ids']
+    assert len(ids) == 25, f'Expected 25 ids, got {body}'
+
+    status, body = request_json('PATCH', '/api/defects:batch',
+                                [{'id': i, 'status': 'RESOLVED'} for i in ids[:10]])
+    assert status == 200 and body == {'updated': 10}, f'Unexpected batch update: {status} {body}'
+    _, page = request_json('GET', '/api/defects?label=v-batch&status=RESOLVED&fields=id')
+    assert [d['id'] for d in page] == ids[:10], 'Batch update should resolve exactly 10 rows'
+
+    status, _ = request('PATCH', '/api/defects:batch', [{'id': ids[0], 'status': 'BOGUS'}])
+    assert status == 400, f'Invalid status should be rejected, got {status}'
+    status, _ = request('POST', '/api/defects:batch', {'title': 'not a list'})
+    assert status == 400, f'Non-array body should be rejected, got {status}'
+    print('/api/defects:batch:         PASS  (25 created, 10 resolved, 1 request each)')
+
+
 def test_ui_served():
     status, raw = request('GET', '/')
     assert status == 200, f'Expected 200 for UI, got {status}'
@@ -73,6 +107,284 @@ def test_ui_served():
     print('GET  /:                     PASS  (UI served)')
 
 
+def test_paginated_defects():
+    for i in range(3):
+        request_json('POST', '/api/defects', {
+            'title': f'Paged {i}', 'date': '2024-03-02', 'label': 'v-page', 'status': 'OPEN',
+        })
+    url = BASE_URL + '/api/defects?label=v-page&limit=2&fields=title'
+    with urllib.request.urlopen(url) as resp:
+        page = json.loads(resp.read())
+        next_after = resp.headers.get('X-Next-After-Id')
+    assert len(page) == 2 and next_after, f'Expected a full page with a cursor, got {page}'
+    assert set(page[0]) == {'id', 'title'}, f'Unexpected fields {set(page[0])}'
+
+    status, rest = request_json('GET', f'/api/defects?label=v-page&limit=2&after_id={next_after}')
+    assert status == 200 and rest and rest[0]['id'] > int(next_after), f'Bad next page {rest}'
+
+    # A filter without limit still gets one capped page, not every match
+    request_json('POST', '/api/defects:batch', [
+        {'title': f'Capped {i}', 'date': '2024-03-03', 'label': 'v-cap', 'status': 'OPEN'}
+        for i in range(MAX_PAGE_SIZE + 1)
+    ])
+    with urllib.request.urlopen(BASE_URL + '/api/defects?label=v-cap&fields=id') as resp:
+        page = json.loads(resp.read())
+        next_after = resp.headers.get('X-Next-After-Id')
+    assert len(page) == MAX_PAGE_SIZE, f'Expected a {MAX_PAGE_SIZE}-row page, got {len(page)}'
+    assert next_after == str(page[-1]['id']), 'A full default page should set X-Next-After-Id'
+    for blank in ('fields=', 'limit=', 'label=&'):
+        with urllib.request.urlopen(BASE_URL + f'/api/defects?{blank}') as resp:
+            page = json.loads(resp.read())
+            assert resp.headers.get('X-Next-After-Id'), f'?{blank} should be paged'
+        assert len(page) == MAX_PAGE_SIZE, f'?{blank} returned {len(page)} rows'
+
+    # The first page of an initial load tells the client where deltas start
+    with urllib.request.urlopen(BASE_URL + '/api/defects?after_id=0&limit=1') as resp:
+        start = resp.headers.get('X-Change-Cursor')
+    assert start and start.isdigit(), f'Expected X-Change-Cursor, got {start!r}'
+    status, body = request_json('GET', f'/api/defects/changes?since={start}')
+    assert status == 200 and body['defects'] == [], 'Nothing changed since the page was read'
+
+    status, _ = request('GET', '/api/defects?fields=nope')
+    assert status == 400, f'Expected 400 for unknown field, got {status}'
+    print('GET  /api/defects?limit=:   PASS  (keyset page + projection, default cap)')
+
+
+def test_defect_changes():
+    status, body = request_json('GET', '/api/defects/changes?since=0')
+    assert status == 200 and body['defects'], f'Expected a full initial sync, got {body}'
+    cursor = body['cursor']
+    while body['more']:
+        _, body = request_json('GET', f'/api/defects/changes?since={cursor}')
+        cursor = body['cursor']
+
+    _, idle = request_json('GET', f'/api/defects/changes?since={cursor}')
+    assert idle == {'defects': [], 'cursor': cursor, 'more': False}, f'Expected no delta, got {idle}'
+
+    _, created = request_json('POST', '/api/defects', {
+        'title': 'Delta sync', 'date': '2024-03-03', 'label': 'v-test', 'status': 'OPEN',
+    })
+    _, delta = request_json('GET', f'/api/defects/changes?since={cursor}')
+    assert [d['id'] for d in delta['defects']] == [created['id']], f'Unexpected delta {delta}'
+    assert delta['cursor'] > cursor
+    print('GET  /api/defects/changes:  PASS  (idle poll empty, new row delivered)')
+
+
+def test_event_stream():
+    url = urlparse(BASE_URL)
+    sock = socket.create_connection((url.hostname, url.port), timeout=5)
+    try:
+        sock.sendall(b'GET /api/events HTTP/1.1\r\nHost: test\r\nAccept: text/event-stream\r\n\r\n')
+        stream = sock.makefile('rb')
+        assert b' 200 ' in stream.readline(), 'Expected 200 for the event stream'
+        while stream.readline().strip() != b'retry: 3000':
+            pass
+
+        _, created = request_json('POST', '/api/defects', {
+            'title': 'Pushed over SSE', 'date': '2024-03-04', 'label': 'v-test', 'status': 'OPEN',
+        })
+        event = {}
+        while not event.get('data'):
+            line = stream.readline().decode().rstrip('\n')
+            if line and not line.startswith(':'):
+                key, _, value = line.partition(': ')
+                event[key] = value
+        payload = json.loads(event['data'])
+        assert event['event'] == 'defects', f'Unexpected event {event}'
+        assert created['id'] in [d['id'] for d in payload['defects']], f'Missing new defect in {payload}'
+        assert int(event['id']) == payload['cursor']
+    finally:
+        sock.close()
+    print('GET  /api/events:           PASS  (create pushed to subscriber)')
+
+
+def test_slow_subscriber_does_not_stall_others():
+    # In-process broker on its own database: one subscriber never reads
+    db_path = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    saved_path, saved_buffer = db.DB_PATH, server.EVENTS_MAX_BUFFER
+    db.DB_PATH, server.EVENTS_MAX_BUFFER = db_path, 64 * 1024
+    broker = server.EventBroker(poll_interval=0.05)
+    stalled, stalled_peer = socket.socketpair()
+    fast, fast_peer = socket.socketpair()
+    try:
+        db.init_db()
+        db.create_defects({'title': f'Backlog {i} ' + 'x' * 100, 'date': '2024-03-05',
+                           'label': 'v-sse', 'status': 'OPEN'} for i in range(2000))
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        stalled.settimeout(5)  # as handed over by a request handler
+        broker.subscribe(stalled, 0)  # ~300 KB backlog it will never read
+        fast.settimeout(5)
+        broker.subscribe(fast, db.get_change_cursor())
+
+        db.create_defect('After the backlog', '2024-03-05', '', 'v-sse', 'OPEN')
+        start = time.perf_counter()
+        broker.notify()
+        fast_peer.settimeout(5)
+        received = b''
+        while b'After the backlog' not in received:
+            received += fast_peer.recv(65536)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        assert elapsed_ms < 1000, f'Fast subscriber waited {elapsed_ms:.0f} ms'
+
+        deadline = time.monotonic() + 5
+        while stalled in broker._clients and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert stalled not in broker._clients, 'A subscriber that falls behind should be dropped'
+    finally:
+        broker.close()
+        for sock in (stalled_peer, fast_peer):
+            sock.close()
+        db.close_write_queue()
+        db_pool.close_all()
+        db.DB_PATH, server.EVENTS_MAX_BUFFER = saved_path, saved_buffer
+        os.unlink(db_path)
+    print(f'slow SSE subscriber:        PASS  (others served in {elapsed_ms:.0f} ms, laggard dropped)')
+
+
+def test_expired_cursor():
+    # In-process server on its own database, keeping only the last 5 changes
+    db_path = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    saved_path, saved_retention = db.DB_PATH, db.CHANGE_RETENTION
+    db.DB_PATH, db.CHANGE_RETENTION = db_path, 5
+    srv = server.PooledHTTPServer(('127.0.0.1', 0), server.RequestHandler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{srv.server_address[1]}'
+    try:
+        db.init_db()
+        db.create_defects({'title': f'Pruned {i}', 'date': '2024-03-06',
+                           'label': 'v-prune', 'status': 'OPEN'} for i in range(20))
+        latest = db.get_change_cursor()
+        try:
+            urllib.request.urlopen(f'{base}/api/defects/changes?since=1')
+            assert False, 'A pruned cursor should not get a partial delta'
+        except urllib.error.HTTPError as e:
+            assert e.code == 410, f'Expected 410 for a pruned cursor, got {e.code}'
+        with urllib.request.urlopen(f'{base}/api/defects/changes?since={latest - 5}') as resp:
+            assert len(json.loads(resp.read())['defects']) == 5, 'Retained changes should be served'
+
+        with urllib.request.urlopen(f'{base}/api/events?since=1', timeout=5) as resp:
+            data = b''
+            while b'\n\n' not in data.split(b'event: reset', 1)[-1]:
+                data += resp.read1(65536)
+        event = data.split(b'event: reset\n', 1)[1].split(b'\n\n', 1)[0]
+        assert event == f'data: {{"cursor": {latest}}}'.encode(), f'Unexpected reset event {event!r}'
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        db.close_write_queue()
+        db_pool.close_all()
+        db.DB_PATH, db.CHANGE_RETENTION = saved_path, saved_retention
+        os.unlink(db_path)
+    print('expired cursor:             PASS  (410 from /changes, reset event on the stream)')
+
+
+def test_conditional_get():
+    for path in ('/api/defects', '/'):
+        with urllib.request.urlopen(BASE_URL + path) as resp:
+            etag = resp.headers.get('ETag')
+        assert etag, f'Expected an ETag on {path}'
+        req = urllib.request.Request(BASE_URL + path, headers={'If-None-Match': etag})
+        try:
+            urllib.request.urlopen(req)
+            assert False, f'Expected 304 for unchanged {path}'
+        except urllib.error.HTTPError as e:
+            assert e.code == 304, f'Expected 304 for {path}, got {e.code}'
+
+    request_json('POST', '/api/defects', {
+        'title': 'Invalidates ETag', 'date': '2024-03-05', 'label': 'v-test', 'status': 'OPEN',
+    })
+    with urllib.request.urlopen(urllib.request.Request(
+            BASE_URL + '/api/defects', headers={'If-None-Match': etag})) as resp:
+        assert resp.status == 200, 'A write should invalidate the API ETag'
+    print('conditional GET:            PASS  (304 when unchanged, 200 after a write)')
+
+
+def test_gzip():
+    req = urllib.request.Request(BASE_URL + '/', headers={'Accept-Encoding': 'gzip'})
+    with urllib.request.urlopen(req) as resp:
+        assert resp.headers.get('Content-Encoding') == 'gzip', 'Expected a gzip response'
+        body = gzip.decompress(resp.read())
+    assert b'<html' in body.lower(), 'Decompressed body should be the UI'
+    with urllib.request.urlopen(BASE_URL + '/') as resp:
+        assert resp.headers.get('Content-Encoding') is None, 'No Accept-Encoding → identity'
+    print('gzip:                       PASS  (negotiated by Accept-Encoding)')
+
+
+def test_metrics():
+    with urllib.request.urlopen(BASE_URL + '/metrics') as resp:
+        assert resp.headers.get('Content-Type', '').startswith('text/plain')
+        text = resp.read().decode()
+    assert 'release_notes_http_requests_total{method="GET",route="/api/defects",status="200"}' \
+        in text, 'Expected per-route request counts'
+    assert 'release_notes_http_request_seconds_bucket' in text
+    assert 'release_notes_db_query_seconds_count{query="get_all_defects"}' in text
+    print('GET  /metrics:              PASS  (Prometheus text, per-route counters)')
+
+
+def test_keep_alive():
+    url = urlparse(BASE_URL)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=5)
+    try:
+        for _ in range(3):
+            conn.request('GET', '/api/defects')
+            resp = conn.getresponse()
+            resp.read()
+            assert resp.status == 200, f'Expected 200, got {resp.status}'
+            assert not resp.will_close, 'Server should keep the connection open'
+    finally:
+        conn.close()
+    print('keep-alive:                 PASS  (3 requests, 1 connection)')
+
+
+def test_failed_requests_end_promptly():
+    url = urlparse(BASE_URL)
+    _, created = request_json('POST', '/api/defects', {
+        'title': 'Bad patch', 'date': '2024-03-04', 'label': 'v-err', 'status': 'OPEN',
+    })
+    # A handler that raises must close the connection, not leave it waiting
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=5)
+    start = time.perf_counter()
+    try:
+        conn.request('PATCH', f'/api/defects/{created["id"]}', json.dumps({'status': 'BOGUS'}),
+                     {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+    except (http.client.RemoteDisconnected, ConnectionError):
+        pass
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    assert elapsed < 2, f'Failed request held the connection for {elapsed:.1f} s'
+
+    # Rejected before parse_request (request line too long): still answered
+    status, _ = request('GET', '/api/defects?' + 'x' * 70000)
+    assert status == 414, f'Expected 414 for an oversized request line, got {status}'
+    status, _ = request('GET', '/api/defects')
+    assert status == 200, 'Server should keep serving after failed requests'
+    print(f'failed requests:            PASS  (closed in {elapsed * 1000:.0f} ms, 414 answered)')
+
+
+def test_slow_client_does_not_block():
+    url = urlparse(BASE_URL)
+    # A client that connects and never sends a request holds one worker only
+    stalled = socket.create_connection((url.hostname, url.port))
+    try:
+        status, _ = request('GET', '/api/defects')
+        assert status == 200, f'Expected 200 alongside a stalled client, got {status}'
+    finally:
+        stalled.close()
+    print('slow client:                PASS  (other requests still served)')
+
+
+def test_port_in_use():
+    url = urlparse(BASE_URL)
+    try:
+        server.PooledHTTPServer((url.hostname, url.port), server.RequestHandler)
+        assert False, 'Binding the running server\'s port should fail'
+    except OSError as exc:  # the bind error itself, not a cleanup AttributeError
+        reason = exc.strerror
+    print(f'port in use:                PASS  ({reason})')
+
+
 def main():
     global BASE_URL
 
@@ -86,7 +398,20 @@ def main():
     test_get_defects()
     defect_id = test_create_defect()
     test_patch_status(defect_id)
+    test_batch_endpoints()
     test_ui_served()
+    test_paginated_defects()
+    test_defect_changes()
+    test_event_stream()
+    test_slow_subscriber_does_not_stall_others()
+    test_expired_cursor()
+    test_conditional_get()
+    test_gzip()
+    test_metrics()
+    test_keep_alive()
+    test_failed_requests_end_promptly()
+    test_slow_client_does_not_block()
+    test_port_in_use()
     print('\nAll server tests passed.')
 
 
@@ -0,0 +1,110 @@
+"""
+Section 11 — Startup tests (no API key needed).
+
+Run from the project root:
+    python tests/test_startup.py
+"""
+import sys
+import os
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import db_pool
+import doc_generator
+
+# Use a temporary database and docs dir so each run starts from a clean slate
+_tmp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+db.DB_PATH = _tmp.name
+_tmp.close()
+doc_generator.DOCS_DIR = tempfile.mkdtemp()
+
+# Import time limit per entry point. The SDK alone takes over a second to
+# import, so loading it eagerly again fails this by a wide margin.
+IMPORT_LIMIT_MS = 500
+HEAVY_MODULES = ('anthropic', 'dotenv', 'docx', 'lxml')
+
+
+def import_ms(module):
+    """Cumulative import time of ``module`` in a fresh interpreter, and what it loaded."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    loaded = set()
+    total_us = None
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        loaded.add(name.split('.')[0])
+        if name == module:
+            total_us = int(cumulative)
+    return total_us / 1000, loaded
+
+
+def test_import_time():
+    results = []
+    for module in ('agent', 'server'):
+        best, loaded = min(import_ms(module) for _ in range(3))
+        heavy = [m for m in HEAVY_MODULES if m in loaded]
+        assert not heavy, f'import {module} should not load {heavy}'
+        assert best < IMPORT_LIMIT_MS, f'import {module} took {best:.0f} ms'
+        results.append(f'{module} {best:.0f} ms')
+    print(f'import time:         PASS  ({", ".join(results)})')
+
+
+def test_init_db_fast_path():
+    start = time.perf_counter()
+    db.init_db()
+    first_ms = (time.perf_counter() - start) * 1000
+    version = db.get_conn().execute('PRAGMA user_version').fetchone()[0]
+    assert version == db.SCHEMA_VERSION, f'user_version should be {db.SCHEMA_VERSION}, got {version}'
+
+    start = time.perf_counter()
+    db.init_db()
+    again_ms = (time.perf_counter() - start) * 1000
+    assert again_ms < first_ms, 'A current schema should skip the DDL'
+
+    # A database laid out before user_version was recorded is brought up to date
+    db.get_conn().execute('PRAGMA user_version = 0')
+    db.init_db()
+    assert db.get_conn().execute('PRAGMA user_version').fetchone()[0] == db.SCHEMA_VERSION
+    print(f'init_db fast path:   PASS  (first {first_ms:.1f} ms, then {again_ms:.2f} ms)')
+
+
+def test_generate_without_sdk():
+    import agent
+
+    db.create_defect('Login crashes on Safari', '2024-01-15', 'Fixed', 'v1.0', 'RESOLVED')
+    assert agent.generate_label('v1.0', None, False) == 0
+    assert os.path.exists(doc_generator._doc_path('v1.0')), '--generate should write the doc'
+    assert agent.generate_label('v9.9', None, False) == 1, 'Unknown labels should fail'
+    assert 'anthropic' not in sys.modules, '--generate should never import the SDK'
+    print('--generate:          PASS  (doc written, SDK not imported)')
+
+
+def teardown():
+    os.remove(doc_generator._doc_path('v1.0'))
+    os.rmdir(doc_generator.DOCS_DIR)
+    db.close_write_queue()
+    db_pool.close_all()
+    os.unlink(db.DB_PATH)
+
+
+def main():
+    print('=== Startup ===')
+    test_import_time()
+    test_init_db_fast_path()
+    test_generate_without_sdk()
+    teardown()
+    print('\nAll startup tests passed.')
+
+
+if __name__ == '__main__':
+    main()